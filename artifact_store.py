@@ -0,0 +1,232 @@
+##############################################################################
+#   CEGUI SDK Builder content-addressed artifact store
+#
+#   Copyright (C) 2014-2016   Timotei Dolean <timotei21@gmail.com>
+#                             and contributing authors (see AUTHORS file)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+##############################################################################
+from __future__ import print_function
+
+import json
+import os
+import shutil
+import threading
+import time
+import build_utils
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# ioctl request for cloning a whole file (btrfs, xfs, ...), see linux/fs.h
+FICLONE = 0x40049409
+
+
+def reflinkFile(src, dst):
+    if fcntl is None:
+        return False
+
+    with open(src, 'rb') as srcFile:
+        with open(dst, 'wb') as dstFile:
+            try:
+                fcntl.ioctl(dstFile.fileno(), FICLONE, srcFile.fileno())
+                cloned = True
+            except (IOError, OSError):
+                cloned = False
+
+    if cloned:
+        shutil.copystat(src, dst)
+    else:
+        os.remove(dst)
+    return cloned
+
+
+def hardlinkFile(src, dst):
+    # os.link is not available on Windows with Python 2
+    if not hasattr(os, "link"):
+        return False
+
+    try:
+        os.link(src, dst)
+        return True
+    except (IOError, OSError):
+        return False
+
+
+def saveJson(path, value):
+    tmpPath = path + ".tmp"
+    with open(tmpPath, 'w') as f:
+        json.dump(value, f)
+    if os.path.exists(path):
+        os.remove(path)
+    os.rename(tmpPath, path)
+
+
+# The blobs live in objects/<first 2 hex digits>/<rest of the sha256>, blobs.json has the size and last use of
+# each of them. Once the store grows past maxSize, the least recently used blobs are evicted, which is always
+# safe: the files linked from a blob keep their content. The whole store can be deleted between runs too.
+class ArtifactStore:
+    def __init__(self, rootDir, maxSize=None):
+        self.rootDir = rootDir
+        self.objectsDir = os.path.join(rootDir, "objects")
+        self.indexPath = os.path.join(rootDir, "index.json")
+        self.blobsPath = os.path.join(rootDir, "blobs.json")
+        self.maxSize = maxSize
+        self.lock = threading.Lock()
+        self.linkedFiles = 0
+        self.copiedFiles = 0
+        # the blobs of this run, which are never evicted
+        self.usedDigests = set()
+
+        build_utils.setupPath(self.objectsDir, False)
+        self.index = self.loadIndex()
+        self.blobs = self.loadBlobs()
+
+    def loadIndex(self):
+        try:
+            with open(self.indexPath, 'r') as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return {}
+
+    # digest -> [size, last use time]; rebuilt from the objects dir when missing
+    def loadBlobs(self):
+        try:
+            with open(self.blobsPath, 'r') as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            pass
+
+        blobs = {}
+        for prefix in os.listdir(self.objectsDir):
+            prefixDir = os.path.join(self.objectsDir, prefix)
+            if not os.path.isdir(prefixDir):
+                continue
+            for name in os.listdir(prefixDir):
+                if not name.endswith(".tmp"):
+                    stat = os.stat(os.path.join(prefixDir, name))
+                    blobs[prefix + name] = [stat.st_size, stat.st_mtime]
+        return blobs
+
+    # removes the least recently used blobs until the store fits in maxSize, returning their count and size
+    def evict(self):
+        totalSize = sum(size for size, _ in self.blobs.values())
+        if self.maxSize is None or totalSize <= self.maxSize:
+            return 0, 0
+
+        evictedBlobs = 0
+        evictedSize = 0
+        for lastUse, digest in sorted((lastUse, digest) for digest, (_, lastUse) in self.blobs.items()
+                                      if digest not in self.usedDigests):
+            if totalSize <= self.maxSize:
+                break
+            try:
+                os.remove(self.getBlobPath(digest))
+            except OSError:
+                pass
+            size = self.blobs.pop(digest)[0]
+            totalSize -= size
+            evictedBlobs += 1
+            evictedSize += size
+        return evictedBlobs, evictedSize
+
+    def save(self):
+        with self.lock:
+            index = dict((path, entry) for path, entry in self.index.items() if os.path.exists(path))
+            evictedBlobs, evictedSize = self.evict()
+            saveJson(self.indexPath, index)
+            saveJson(self.blobsPath, self.blobs)
+
+        print("*** Artifact store: %d file(s) linked, %d file(s) copied." % (self.linkedFiles, self.copiedFiles))
+        if evictedBlobs:
+            print("*** Artifact store: evicted %d unused blob(s) (%.1f MB) to stay under %.1f MB." %
+                  (evictedBlobs, evictedSize / 1048576.0, self.maxSize / 1048576.0))
+
+    # hashing is the expensive part, so remember the digest of each source file for as long as it doesn't change
+    def getDigest(self, path):
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+
+        with self.lock:
+            entry = self.index.get(path)
+        if entry is not None and entry[0] == stat.st_size and entry[1] == stat.st_mtime:
+            return entry[2]
+
+        digest = build_utils.hashFile(path)
+        with self.lock:
+            self.index[path] = [stat.st_size, stat.st_mtime, digest]
+        return digest
+
+    def getBlobPath(self, digest):
+        return os.path.join(self.objectsDir, digest[:2], digest[2:])
+
+    def add(self, path):
+        digest = self.getDigest(path)
+        blobPath = self.getBlobPath(digest)
+        if os.path.exists(blobPath):
+            self.markUsed(digest, blobPath)
+            return blobPath
+
+        blobDir = os.path.dirname(blobPath)
+        if not os.path.isdir(blobDir):
+            try:
+                os.makedirs(blobDir)
+            except OSError:
+                if not os.path.isdir(blobDir):
+                    raise
+
+        # build outputs may be rewritten in place by the next build (e.g. incremental linking),
+        # so they are never hard linked into the store, only cloned or copied
+        tmpPath = "%s.%d.%d.tmp" % (blobPath, os.getpid(), threading.current_thread().ident)
+        if not reflinkFile(path, tmpPath):
+            shutil.copy2(path, tmpPath)
+
+        try:
+            os.rename(tmpPath, blobPath)
+        except OSError:
+            # somebody else stored the same content in the meantime
+            os.remove(tmpPath)
+
+        self.markUsed(digest, blobPath)
+        return blobPath
+
+    def markUsed(self, digest, blobPath):
+        size = os.path.getsize(blobPath)
+        with self.lock:
+            self.blobs[digest] = [size, time.time()]
+            self.usedDigests.add(digest)
+
+    # places a file with the same content as 'src' at 'dst', sharing the storage with every other
+    # copy of the same content when the filesystem allows it. Returns False if 'dst' was already up to date.
+    def materialize(self, src, dst):
+        blobPath = self.add(src)
+
+        if os.path.exists(dst):
+            if hasattr(os.path, "samefile") and os.path.samefile(blobPath, dst):
+                return False
+            os.remove(dst)
+
+        linked = hardlinkFile(blobPath, dst) or reflinkFile(blobPath, dst)
+        if not linked:
+            shutil.copy2(blobPath, dst)
+
+        with self.lock:
+            if linked:
+                self.linkedFiles += 1
+            else:
+                self.copiedFiles += 1
+
+        return True
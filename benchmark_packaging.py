@@ -0,0 +1,220 @@
+#!/usr/bin/env python2
+##############################################################################
+#   CEGUI SDK Builder packaging and copy benchmarks
+#
+#   Copyright (C) 2014-2016   Timotei Dolean <timotei21@gmail.com>
+#                             and contributing authors (see AUTHORS file)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+##############################################################################
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import build_utils
+import sdk_packager
+from build_cegui_dependencies_windows import CEGUIDependenciesSDK
+from build_cegui_windows import CEGUISDK
+from sdk_builder import BuildDetails, CMakeArgs
+
+STUB_BUILD_COMMAND = [sys.executable, "-c", "pass"]
+BENCHMARK_CONFIGS = ["Debug", "RelWithDebInfo"]
+
+
+def writeFile(path, content):
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    with open(path, 'wb') as f:
+        f.write(content)
+
+
+def binaryContent(sizeMB):
+    # roughly as compressible as real binaries and debug symbols
+    chunk = os.urandom(256 * 1024) + b"\0" * (768 * 1024)
+    return chunk * sizeMB
+
+
+def headerContent(index):
+    return (("// synthetic header %d\n" % index) + "class Foo%d { public: void bar(int baz); };\n" % index * 40).encode()
+
+
+# Trees shaped like the CEGUI output: many small headers, a few large binaries and lots of datafiles
+class SyntheticTrees:
+    def __init__(self, rootDir, settings):
+        self.rootDir = rootDir
+        self.settings = settings
+        self.srcDir = os.path.join(rootDir, "src")
+        self.dependenciesDir = os.path.join(rootDir, "dependencies")
+
+    def generate(self):
+        settings = self.settings
+        for index in range(settings.headers):
+            writeFile(os.path.join(self.srcDir, "cegui", "include", "CEGUI", "Header%d.h" % index),
+                      headerContent(index))
+        for index in range(settings.datafiles):
+            extension = ["xml", "imageset", "png", "font"][index % 4]
+            content = os.urandom(32 * 1024) if extension == "png" else headerContent(index)
+            writeFile(os.path.join(self.srcDir, "datafiles", "dir%d" % (index % 10), "file%d.%s" % (index, extension)),
+                      content)
+        writeFile(os.path.join(self.srcDir, "README.md"), b"README\n")
+        writeFile(os.path.join(self.srcDir, "COPYING"), b"COPYING\n")
+        writeFile(os.path.join(self.srcDir, "CMakeLists.txt"), b"project(synthetic)\n")
+
+        binary = binaryContent(settings.binary_size)
+        for config in BENCHMARK_CONFIGS:
+            buildDir = os.path.join(self.srcDir, "build-mingw-" + config)
+            for index in range(settings.binaries):
+                writeFile(os.path.join(buildDir, "bin", "CEGUIModule%d_%s.dll" % (index, config)), binary)
+                writeFile(os.path.join(buildDir, "bin", "CEGUIModule%d_%s.pdb" % (index, config)), binary)
+                writeFile(os.path.join(buildDir, "lib", "libCEGUIModule%d_%s.dll.a" % (index, config)),
+                          headerContent(index))
+                writeFile(os.path.join(buildDir, "dependencies", "bin", "dep%d_%s.dll" % (index, config)), binary)
+                writeFile(os.path.join(buildDir, "dependencies", "lib", "static", "dep%d_%s.a" % (index, config)),
+                          binary)
+            writeFile(os.path.join(buildDir, "cegui", "include", "CEGUI", "Config.h"), headerContent(0))
+            writeFile(os.path.join(buildDir, "datafiles", "samples", "samples.xml"), b"<Samples/>\n")
+            for index in range(settings.headers // 10):
+                writeFile(os.path.join(buildDir, "dependencies", "include", "dep", "Header%d.h" % index),
+                          headerContent(index))
+
+        build_utils.copytree(os.path.join(self.srcDir, "build-mingw-Debug", "dependencies"), self.dependenciesDir)
+
+
+def countTree(path):
+    files, size = 0, 0
+    for root, dirs, names in os.walk(path):
+        for name in names:
+            files += 1
+            size += os.path.getsize(os.path.join(root, name))
+    return files, size
+
+
+# the real pipeline (gathering, packaging, caching) with the toolchain replaced by no-op commands
+def createBenchmarkSDK(sdkClass, trees, workDir, extraArgs=None):
+    class BenchmarkSDK(sdkClass):
+        def ensureCanBuildSDK(self):
+            pass
+
+        def configureBuild(self, build):
+            build_utils.setupPath(os.path.join(self.srcDir, build.buildDir), False)
+            return 0
+
+        def createSDKBuilds(self):
+            return {"mingw": [BuildDetails("mingw", "build-mingw-" + config, CMakeArgs("MinGW Makefiles", []),
+                                           [STUB_BUILD_COMMAND]) for config in BENCHMARK_CONFIGS]}
+
+    args = ["-s", trees.srcDir, "-t", "mingw",
+            "--config-file", os.path.join(workDir, "config.json"),
+            "--history-file", os.path.join(workDir, "history.jsonl"),
+            "--artifacts-dir", os.path.join(workDir, "artifacts"),
+            "--artifacts-unarchived-dir", os.path.join(workDir, "artifacts", "unarchived"),
+            "--cache-dir", os.path.join(workDir, "cache"),
+            "--trace-file", "", "--force-build"] + (extraArgs or [])
+    return BenchmarkSDK(sdkClass.getArgParse().parse_args(args))
+
+
+class Benchmarks:
+    def __init__(self, trees, workDir, quiet=True):
+        self.trees = trees
+        self.workDir = workDir
+        self.quiet = quiet
+        self.results = []
+
+    def run(self, name, function, measuredTree):
+        stdout = sys.stdout
+        if self.quiet:
+            sys.stdout = open(os.devnull, 'w')
+        try:
+            startTime = time.time()
+            function()
+            duration = time.time() - startTime
+        finally:
+            if self.quiet:
+                sys.stdout.close()
+                sys.stdout = stdout
+
+        files, size = countTree(measuredTree)
+        self.results.append({"name": name, "seconds": duration, "files": files, "bytes": size,
+                             "filesPerSecond": files / duration if duration > 0 else 0.0,
+                             "mbPerSecond": size / 1048576.0 / duration if duration > 0 else 0.0})
+
+    def runAll(self):
+        trees = self.trees
+        datafilesDir = os.path.join(trees.srcDir, "datafiles")
+        copyDir = os.path.join(self.workDir, "copy")
+
+        self.run("copytree (cold)", lambda: build_utils.copytree(datafilesDir, copyDir), datafilesDir)
+        self.run("copytree (up to date)", lambda: build_utils.copytree(datafilesDir, copyDir), datafilesDir)
+
+        binDir = os.path.join(trees.srcDir, "build-mingw-Debug", "bin")
+        self.run("copyFiles", lambda: build_utils.copyFiles(binDir, os.path.join(self.workDir, "copyfiles")), binDir)
+
+        zipPath = os.path.join(self.workDir, "datafiles.zip")
+        self.run("makeZip (full)", lambda: sdk_packager.Packager(incremental=False).makeZips(
+            ["datafiles"], [sdk_packager.ArchiveSpec(zipPath)], trees.srcDir), datafilesDir)
+        self.run("makeZip (incremental)", lambda: sdk_packager.Packager().makeZips(
+            ["datafiles"], [sdk_packager.ArchiveSpec(zipPath)], trees.srcDir), datafilesDir)
+
+        for sdkName, sdkClass, extraArgs in [("dependencies", CEGUIDependenciesSDK, []),
+                                             ("cegui", CEGUISDK, ["-d", trees.dependenciesDir])]:
+            sdkWorkDir = os.path.join(self.workDir, sdkName)
+            unarchivedDir = os.path.join(sdkWorkDir, "artifacts", "unarchived")
+            for run in ["cold", "warm"]:
+                self.run("%s gather+package (%s)" % (sdkName, run),
+                         lambda: createBenchmarkSDK(sdkClass, trees, sdkWorkDir, extraArgs).build(), unarchivedDir)
+
+    def printReport(self):
+        print("%-36s %10s %8s %10s %12s %10s" % ("benchmark", "seconds", "files", "MB", "files/s", "MB/s"))
+        for result in self.results:
+            print("%-36s %10.3f %8d %10.2f %12.1f %10.2f" % (
+                result["name"], result["seconds"], result["files"], result["bytes"] / 1048576.0,
+                result["filesPerSecond"], result["mbPerSecond"]))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the copy and packaging paths of the SDK builder on "
+                                                 "synthetic SDK trees, without any real toolchain.")
+    parser.add_argument("--work-dir", default=None,
+                        help="Where to generate the synthetic trees. Defaults to a temporary directory which is "
+                             "removed afterwards.")
+    parser.add_argument("--headers", type=int, default=2000, help="Number of synthetic headers")
+    parser.add_argument("--datafiles", type=int, default=1000, help="Number of synthetic datafiles")
+    parser.add_argument("--binaries", type=int, default=4, help="Number of large binaries (and PDBs) per config")
+    parser.add_argument("--binary-size", type=int, default=16, help="Size of each large binary, in MB")
+    parser.add_argument("--json-output", default=None, help="Also write the results as JSON to this file")
+    parser.add_argument("--verbose", action="store_true", help="Show the output of the benchmarked code")
+    args = parser.parse_args()
+
+    workDir = os.path.abspath(args.work_dir) if args.work_dir else tempfile.mkdtemp(prefix="sdk-builder-bench-")
+    try:
+        trees = SyntheticTrees(os.path.join(workDir, "trees"), args)
+        print("*** Generating synthetic trees in '%s' ..." % workDir)
+        trees.generate()
+
+        benchmarks = Benchmarks(trees, os.path.join(workDir, "runs"), not args.verbose)
+        benchmarks.runAll()
+        benchmarks.printReport()
+
+        if args.json_output:
+            with open(args.json_output, 'w') as f:
+                json.dump(benchmarks.results, f, indent=2)
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(workDir)
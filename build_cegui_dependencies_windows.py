@@ -19,81 +19,304 @@
 #   along with this program.  If not, see <http://www.gnu.org/licenses/>.
 ##############################################################################
 from __future__ import print_function
-import collections
-from distutils import dir_util
+import hashlib
+import json
 import re
-import shutil
 import os
+import shutil
+import zipfile
 import time
 import build_utils
-from sdk_builder import SDKBuilder, BuildDetails, CMakeArgs
+import debug_symbols
+from build_output import printMessage
+from sdk_builder import SDKBuilder, BuildDetails
+from path_filter import PathFilter
+from sdk_packager import ArchiveSpec
+
+
+DEPENDENCY_CONFIGS = ["Debug", "RelWithDebInfo"]
+
+# the libraries which have to be built before others, for the per-library builds
+LIBRARY_DEPENDENCIES = {
+    "MINIZIP": ["ZLIB"]
+}
+
+
+class LibraryBuildDetails(BuildDetails):
+    def __init__(self, compiler, buildDir, cmakeArgs, buildCommands, library):
+        BuildDetails.__init__(self, compiler, buildDir, cmakeArgs, buildCommands)
+        self.library = library
+        # where the outputs of the build are cached, which depends on all its inputs
+        self.outputDir = None
 
 
 class CEGUIDependenciesSDK(SDKBuilder):
     def __init__(self, args):
+        # the builds of a library need the outputs of its dependencies, which only exist locally
+        if args.per_library_builds and args.workers:
+            printMessage("*** The per-library builds can't run on build workers!")
+            exit(1)
+
+        self.librarySourcesHashes = {}
+        self.sharedSourcesHash = None
         SDKBuilder.__init__(self, args, "cegui-dependencies")
 
+    def getArtifactDirName(self, toolchain):
+        return "cegui-dependencies-" + toolchain
+
+    def getArtifactZipPath(self, toolchain):
+        return os.path.join(self.artifactsPath, self.getArtifactDirName(toolchain) + ".zip")
+
+    # everything the dependency SDK of a toolchain is built from
+    def getFingerprintInputs(self, toolchain):
+        enabledLibs, disabledLibs = self.getLibraries(toolchain)
+        return {"toolchain": self.getToolchainDetails(toolchain), "enabledLibs": enabledLibs,
+                "disabledLibs": disabledLibs, "configs": self.getConfigs(DEPENDENCY_CONFIGS),
+                "targets": self.getTargets(), "sources": self.getSourceTreeHash(),
+                "debugSymbols": self.args.debug_symbols}
+
+    def getFingerprint(self, toolchain):
+        inputs = json.dumps(self.getFingerprintInputs(toolchain), sort_keys=True)
+        return hashlib.sha256(inputs.encode('utf-8')).hexdigest()
+
+    # the fingerprint is stored next to the zip, so both can be kept (or copied around) together
+    def getFingerprintPath(self, toolchain):
+        return self.getArtifactZipPath(toolchain) + ".fingerprint"
+
+    def saveFingerprint(self, toolchain):
+        with open(self.getFingerprintPath(toolchain), 'w') as f:
+            json.dump({"fingerprint": self.getFingerprint(toolchain), "inputs": self.getFingerprintInputs(toolchain)},
+                      f, indent=2, sort_keys=True)
+
+    def getArchiveNames(self, compiler):
+        names = [os.path.basename(self.getArtifactZipPath(compiler))]
+        if self.args.debug_symbols == "archive":
+            names.append(os.path.basename(debug_symbols.getSymbolArchivePath(names[0])))
+        return names
+
+    def isToolchainUpToDate(self, toolchain, restore=True):
+        zipPath = self.getArtifactZipPath(toolchain)
+        try:
+            with open(self.getFingerprintPath(toolchain), 'r') as f:
+                savedFingerprint = json.load(f).get("fingerprint")
+        except (IOError, OSError, ValueError):
+            return False
+        missingArchives = [name for name in self.getArchiveNames(toolchain)
+                           if not os.path.isfile(os.path.join(self.artifactsPath, name))]
+        if missingArchives or savedFingerprint != self.getFingerprint(toolchain):
+            return False
+
+        unarchivedPath = os.path.join(self.artifactsUnarchivedPath, self.getArtifactDirName(toolchain))
+        if restore and not os.path.isdir(unarchivedPath):
+            printMessage("*** Unpacking the existing '%s' to '%s' ..." % (zipPath, unarchivedPath))
+            # unpacked next to its final location and then renamed, so an interrupted unpack is never used.
+            # The archive entries are relative to the unarchived artifacts dir.
+            tempPath = unarchivedPath + ".tmp"
+            build_utils.setupPath(tempPath)
+            for name in self.getArchiveNames(toolchain):
+                with zipfile.ZipFile(os.path.join(self.artifactsPath, name)) as f:
+                    f.extractall(tempPath)
+            os.rename(os.path.join(tempPath, self.getArtifactDirName(toolchain)), unarchivedPath)
+            shutil.rmtree(tempPath)
+        return True
+
     def gatherArtifacts(self, compiler, builds):
-        print("*** Gathering artifacts for CEGUI dependencies for '%s' compiler ..." % compiler)
+        printMessage("*** Gathering artifacts for CEGUI dependencies for '%s' compiler ..." % compiler)
 
-        artifactDirName = "cegui-dependencies-" + builds[0].compiler
-        artifactZipName = artifactDirName + ".zip"
+        artifactDirName = self.getArtifactDirName(compiler)
         depsGatherPath = os.path.join(self.artifactsUnarchivedPath, artifactDirName)
 
         for build in builds:
-            depsPath = os.path.join(self.srcDir, build.buildDir, "dependencies")
-            print("*** From", depsPath, "to", depsGatherPath, "...")
+            depsPath = self.getBuildOutputDir(build)
+            printMessage("*** From", depsPath, "to", depsGatherPath, "...")
             if not os.path.isdir(depsPath):
-                print("*** ERROR: no dependencies directory found, nothing will be generated!")
+                printMessage("*** ERROR: no dependencies directory found, nothing will be generated!")
                 return
 
-            dir_util.copy_tree(depsPath, depsGatherPath)
-
-        shutil.copy(os.path.join(self.srcDir, "README.md"), depsGatherPath)
-
-        os.chdir(self.artifactsUnarchivedPath)
-        patternsToIgnore = [".*\\.ilk", ".*" + re.escape(os.path.join("lib", "static"))]
-        build_utils.makeZip([artifactDirName], artifactZipName, patternsToIgnore)
-        shutil.move(artifactZipName, os.path.join(self.artifactsPath, artifactZipName))
+            build_utils.copytree(depsPath, depsGatherPath, store=self.artifactStore)
 
-        print("*** Done gathering artifacts for CEGUI dependencies.")
+        build_utils.copyFile(os.path.join(self.srcDir, "README.md"), os.path.join(depsGatherPath, "README.md"),
+                             self.artifactStore)
 
-    def createSDKBuilds(self):
-        builds = collections.defaultdict(list)
-        extraCMakeArgs = []
+        staticLibsDir = [".*" + re.escape(os.path.join("lib", "static"))]
+        pathFilter = PathFilter(excludeFiles=self.getArchiveExcludes("*.ilk"), pruneDirRegexes=staticLibsDir)
+        self.packageArtifacts(compiler, [artifactDirName], [ArchiveSpec(self.getArtifactZipPath(compiler), pathFilter=pathFilter)],
+                              self.getSymbolsSpec(self.getArtifactZipPath(compiler), pruneDirRegexes=staticLibsDir))
+        self.saveFingerprint(compiler)
 
-        def toCMakeSwitchTuples(libs, val):
-            return [(lib, val) for lib in libs]
+        printMessage("*** Done gathering artifacts for CEGUI dependencies.")
 
+    @staticmethod
+    def getLibraries(toolchain):
         enabledLibs = ['MINIZIP', 'TINYXML', 'EXPAT', 'CORONA', 'FREEIMAGE', 'SILLY', 'FREETYPE2', 'GLEW', 'GLFW', 'GLM', 'PCRE', 'ZLIB']
         disabledLibs = ['DEVIL', 'EFFECTS11', 'LUA']
 
         # Xerces doesn't build right on MinGW 32 (it requires intrin.h which doesn't exist in the default distribution)
-        if self.toolchain == "mingw":
+        if toolchain == "mingw":
             disabledLibs.append('XERCES')
         else:
             enabledLibs.append('XERCES')
 
-        for libBuildMapping in toCMakeSwitchTuples(enabledLibs, 'YES') + toCMakeSwitchTuples(disabledLibs, 'NO'):
-            extraCMakeArgs.append("-DCEGUI_BUILD_%s=%s" % libBuildMapping)
-
-        configs = ["Debug", "RelWithDebInfo"]
-        cmakeGenerator = self.getCMakeGenerator(self.toolchain)
-        if self.toolchain == "mingw":
-            for config in configs:
-                builds["mingw"].append(
-                    BuildDetails("mingw", "build-mingw-" + config,
-                                 CMakeArgs(cmakeGenerator, ["-DCMAKE_BUILD_TYPE=" + config] + extraCMakeArgs),
-                                 [build_utils.generateMingwMakeCommand()]))
-        else:
-            builds[self.toolchain].append(
-                BuildDetails(self.toolchain, "build-" + self.toolchain,
-                             CMakeArgs(cmakeGenerator, extraCMakeArgs),
-                             [build_utils.generateMSBuildCommand("CEGUI-DEPS.sln", config) for config in configs]))
+        return enabledLibs, disabledLibs
+
+    @staticmethod
+    def getCMakeSwitches(enabledLibs, disabledLibs):
+        def toCMakeSwitchTuples(libs, val):
+            return [(lib, val) for lib in libs]
+
+        return ["-DCEGUI_BUILD_%s=%s" % libBuildMapping
+                for libBuildMapping in toCMakeSwitchTuples(enabledLibs, 'YES') + toCMakeSwitchTuples(disabledLibs, 'NO')]
+
+    def createToolchainBuilds(self, toolchain):
+        enabledLibs, disabledLibs = self.getLibraries(toolchain)
+        if self.args.per_library_builds:
+            return self.createLibraryBuilds(toolchain, enabledLibs, disabledLibs)
+
+        return self.createBuilds(BuildDetails, toolchain, "", self.getCMakeSwitches(enabledLibs, disabledLibs))
+
+    def createBuilds(self, buildClass, toolchain, buildDirSuffix, extraCMakeArgs, *extraArgs):
+        return self.createConfigBuilds(buildClass, toolchain, buildDirSuffix, extraCMakeArgs,
+                                       self.getConfigs(DEPENDENCY_CONFIGS), "CEGUI-DEPS", *extraArgs)
+
+    def getLibraryDependencies(self, library):
+        return self.config.get("libraryDependencies", LIBRARY_DEPENDENCIES).get(library, [])
+
+    # every enabled library becomes its own set of builds, which only start after the builds (with the same
+    # configs) of the libraries it depends on, and find their outputs through CMAKE_PREFIX_PATH
+    def createLibraryBuilds(self, toolchain, enabledLibs, disabledLibs):
+        libraryBuilds = {}
+        for library in self.sortLibraries(enabledLibs):
+            dependencies = [dependency for dependency in self.getLibraryDependencies(library)
+                            if dependency in enabledLibs]
+            otherLibs = [lib for lib in enabledLibs + disabledLibs if lib != library]
+            builds = self.createBuilds(LibraryBuildDetails, toolchain, "-" + library.lower(),
+                                       self.getCMakeSwitches([library], otherLibs), library)
+            for index, build in enumerate(builds):
+                build.dependencies = [libraryBuilds[dependency][index] for dependency in dependencies]
+                if build.dependencies:
+                    build.cmakeArgs.extraArgs = build.cmakeArgs.extraArgs + [
+                        "-DCMAKE_PREFIX_PATH=" + ";".join(dependency.outputDir for dependency in build.dependencies)]
+                build.outputDir = os.path.join(self.cacheDir, "libraries", self.getLibraryFingerprint(build))
+            libraryBuilds[library] = builds
+
+        return [build for library in self.sortLibraries(enabledLibs) for build in libraryBuilds[library]]
+
+    def sortLibraries(self, libraries):
+        sortedLibraries = []
+
+        def visit(library, path):
+            if library in path:
+                printMessage("*** The library dependencies contain a cycle:", " -> ".join(path + [library]))
+                exit(1)
+            if library in sortedLibraries or library not in libraries:
+                return
+            for dependency in self.getLibraryDependencies(library):
+                visit(dependency, path + [library])
+            sortedLibraries.append(library)
+
+        for library in libraries:
+            visit(library, [])
+        return sortedLibraries
+
+    def getLibraryFingerprint(self, build):
+        inputs = {"library": build.library, "toolchain": self.getToolchainDetails(build.compiler),
+                  "generator": build.cmakeArgs.generator, "cmakeArgs": build.cmakeArgs.extraArgs,
+                  "configs": self.getConfigs(DEPENDENCY_CONFIGS), "targets": self.getTargets(),
+                  "sources": self.getLibrarySourcesHash(build.library), "shared": self.getSharedSourcesHash()}
+        return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def getLibrarySourceDir(self, library):
+        sourceDirs = self.config.get("librarySourceDirs", {})
+        if library in sourceDirs:
+            return os.path.join(self.srcDir, sourceDirs[library])
+
+        # e.g. 'src/freetype-2.4.4' for FREETYPE2
+        sourcesRoot = os.path.join(self.srcDir, "src")
+        prefixes = [library.lower(), library.lower().rstrip("0123456789")]
+        if os.path.isdir(sourcesRoot):
+            for name in sorted(os.listdir(sourcesRoot)):
+                normalizedName = re.sub("[^a-z0-9]", "", name.lower())
+                if os.path.isdir(os.path.join(sourcesRoot, name)) and \
+                        [prefix for prefix in prefixes if normalizedName.startswith(prefix)]:
+                    return os.path.join(sourcesRoot, name)
+        return None
+
+    def getLibrarySourcesHash(self, library):
+        if library not in self.librarySourcesHashes:
+            sourceDir = self.getLibrarySourceDir(library)
+            if sourceDir is None:
+                printMessage("*** No source dir found for '%s' (see 'librarySourceDirs' in the config file), "
+                             "it will be rebuilt whenever any source changes." % library)
+                self.librarySourcesHashes[library] = self.getSourceTreeHash()
+            else:
+                self.librarySourcesHashes[library] = build_utils.hashSourceTree(sourceDir)
+        return self.librarySourcesHashes[library]
+
+    # the files shared by all the libraries: the top level CMake scripts and everything under 'cmake'
+    def getSharedSourcesHash(self):
+        if self.sharedSourcesHash is None:
+            hasher = hashlib.sha256()
+            for directory in [self.srcDir, os.path.join(self.srcDir, "src")]:
+                if not os.path.isdir(directory):
+                    continue
+                for name in sorted(os.listdir(directory)):
+                    path = os.path.join(directory, name)
+                    if os.path.isfile(path):
+                        hasher.update(os.path.relpath(path, self.srcDir).replace(os.sep, '/').encode('utf-8'))
+                        hasher.update(build_utils.hashFile(path).encode('ascii'))
+
+            cmakeDir = os.path.join(self.srcDir, "cmake")
+            if os.path.isdir(cmakeDir):
+                hasher.update(build_utils.hashSourceTree(cmakeDir).encode('ascii'))
+            self.sharedSourcesHash = hasher.hexdigest()
+        return self.sharedSourcesHash
+
+    # library builds whose outputs are already cached are not built again; the outputs of the others are
+    # added to the cache once built
+    def runBuild(self, build):
+        if not isinstance(build, LibraryBuildDetails):
+            return SDKBuilder.runBuild(self, build)
+
+        if self.isBuildCached(build):
+            printMessage("*** '%s' was already built from the same inputs, reusing '%s'." %
+                         (build.buildDir, build.outputDir))
+            return 0
+
+        returnCode = SDKBuilder.runBuild(self, build)
+        if returnCode != 0:
+            return returnCode
+
+        depsPath = os.path.join(self.srcDir, build.buildDir, "dependencies")
+        if not os.path.isdir(depsPath):
+            printMessage("*** ERROR: no dependencies directory found in '%s'!" % build.buildDir)
+            return 1
+
+        tempOutputDir = build.outputDir + ".tmp"
+        build_utils.setupPath(tempOutputDir)
+        build_utils.copytree(depsPath, tempOutputDir)
+        os.rename(tempOutputDir, build.outputDir)
+        return 0
+
+    def getRemoteOutputDirs(self, build):
+        return ["dependencies"]
+
+    def isBuildCached(self, build):
+        return isinstance(build, LibraryBuildDetails) and os.path.isdir(build.outputDir)
+
+    def getBuildOutputDir(self, build):
+        if isinstance(build, LibraryBuildDetails):
+            return build.outputDir
+        return os.path.join(self.srcDir, build.buildDir, "dependencies")
 
-        return builds
+    @classmethod
+    def getArgParse(cls):
+        parser = cls.getDefaultArgParse("cegui-dependencies")
+        parser.add_argument("--per-library-builds", action="store_true",
+                            help="Build and cache each library separately, instead of all of them in one build. The "
+                                 "libraries are built in parallel, after the ones they depend on, and only the ones "
+                                 "whose inputs changed are built again.")
+        return parser
 
 if __name__ == "__main__":
-    parser = SDKBuilder.getDefaultArgParse("cegui-dependencies")
-    depsSDK = CEGUIDependenciesSDK(parser.parse_args())
+    depsSDK = CEGUIDependenciesSDK(CEGUIDependenciesSDK.getArgParse().parse_args())
     depsSDK.build()
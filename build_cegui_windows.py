@@ -19,26 +19,64 @@
 #   along with this program.  If not, see <http://www.gnu.org/licenses/>.
 ##############################################################################
 from __future__ import print_function
-import collections
+import hashlib
 import subprocess
-from distutils import dir_util
-import shutil
 import os
+import shutil
 import build_utils
+import debug_symbols
+from build_output import printMessage
+from build_trace import waitForProcess
 from build_utils import doCopy
-from sdk_builder import BuildDetails, CMakeArgs, SDKBuilder
+from sdk_builder import BuildDetails, SDKBuilder
+from sdk_packager import ArchiveSpec
+
+TOOLCHAIN_PLACEHOLDER = "{toolchain}"
+CEGUI_CONFIGS = ["Debug", "RelWithDebInfo"]
+# how many versions of the documentation are kept in the cache, the most recently used ones
+DOCUMENTATION_CACHE_ENTRIES = 3
 
 
 class CEGUISDK(SDKBuilder):
     def __init__(self, args):
+        if len(args.toolchain) > 1 and TOOLCHAIN_PLACEHOLDER not in args.dependencies_dir:
+            printMessage("*** The dependencies dir must contain the '%s' placeholder when building for multiple "
+                         "toolchains!" % TOOLCHAIN_PLACEHOLDER)
+            exit(1)
+
+        self.sharedArtifacts = None
+        self.documentationDir = None
+        self.dependenciesHashes = {}
         SDKBuilder.__init__(self, args, "cegui")
 
+    def getDependenciesDir(self, toolchain):
+        return self.args.dependencies_dir.replace(TOOLCHAIN_PLACEHOLDER, toolchain)
+
+    # the dependency SDK is built against and copied into the SDK; it doesn't change during a run
+    def getExternalInputsHash(self, toolchain):
+        with self.hashLock:
+            if toolchain not in self.dependenciesHashes:
+                self.dependenciesHashes[toolchain] = build_utils.hashSourceTree(self.getDependenciesDir(toolchain),
+                                                                                contentHash=False)
+            return self.dependenciesHashes[toolchain]
+
+    def gatherSharedArtifacts(self):
+        printMessage("*** Gathering the toolchain independent artifacts of CEGUI ...")
+        self.sharedArtifacts = build_utils.CopyPlan()
+        self.sharedArtifacts.dirs.append("datafiles")
+        build_utils.planCopy(os.path.join(self.srcDir, "datafiles"), build_utils.ignorePatterns('CMakeLists.txt'),
+                             self.sharedArtifacts, "datafiles")
+
+        for extraFile in ["README.md", "COPYING"]:
+            self.sharedArtifacts.addFile(os.path.join(self.srcDir, extraFile), extraFile)
+
     def gatherArtifacts(self, compiler, builds):
-        print("*** Gathering artifacts of CEGUI for '%s' compiler ..." % compiler)
+        printMessage("*** Gathering artifacts of CEGUI for '%s' compiler ..." % compiler)
 
         artifactZipNamePrefix = "cegui-sdk-%s" % compiler
         artifactDirName = artifactZipNamePrefix
         depsGatherPath = os.path.join(self.artifactsUnarchivedPath, artifactDirName)
+        store = self.artifactStore
 
         for build in builds:
             buildDir = os.path.join(self.srcDir, build.buildDir)
@@ -47,85 +85,174 @@ class CEGUISDK(SDKBuilder):
             doCopy(os.path.join(buildDir, "cegui/include"), os.path.join(buildDir, "include"))
             doCopy(os.path.join(self.srcDir, "cegui/include"), os.path.join(buildDir, "include"))
 
-            doCopy(os.path.join(buildDir, 'datafiles/samples'), os.path.join(depsGatherPath, 'datafiles/samples'), build_utils.ignoreNonMatchingFiles('samples.xml'))
-            doCopy(os.path.join(buildDir, 'bin'), os.path.join(depsGatherPath, 'bin'), shutil.ignore_patterns('*.ilk'))
-            doCopy(os.path.join(buildDir, 'lib'), os.path.join(depsGatherPath, 'lib'), shutil.ignore_patterns('*.exp'))
-            doCopy(os.path.join(buildDir, 'include'), os.path.join(depsGatherPath, 'include'), build_utils.ignoreNonMatchingFiles('*.h'))
+            doCopy(os.path.join(buildDir, 'datafiles/samples'), os.path.join(depsGatherPath, 'datafiles/samples'), build_utils.ignoreNonMatchingFiles('samples.xml'), store)
+            doCopy(os.path.join(buildDir, 'bin'), os.path.join(depsGatherPath, 'bin'), build_utils.ignorePatterns('*.ilk'), store)
+            doCopy(os.path.join(buildDir, 'lib'), os.path.join(depsGatherPath, 'lib'), build_utils.ignorePatterns('*.exp'), store)
+            doCopy(os.path.join(buildDir, 'include'), os.path.join(depsGatherPath, 'include'), build_utils.ignoreNonMatchingFiles('*.h'), store)
 
-        doCopy(os.path.join(self.srcDir, "datafiles"), os.path.join(depsGatherPath, "datafiles"), shutil.ignore_patterns('CMakeLists.txt'))
+        # datafiles, README and COPYING
+        build_utils.doCopyPlan(self.sharedArtifacts, depsGatherPath, store)
 
-        doxygenDocDir = os.path.join(self.getDoxyfileDir(builds[0]), "html")
-        if os.path.exists(doxygenDocDir):
-            dir_util.copy_tree(doxygenDocDir, os.path.join(depsGatherPath, "doc"))
+        # not set when the documentation step was skipped by --resume
+        if self.documentationDir is None:
+            self.documentationDir = self.findDocumentationDir(builds[0])
+        if self.documentationDir is not None and os.path.exists(self.documentationDir):
+            doCopy(self.documentationDir, os.path.join(depsGatherPath, "doc"), store=store)
 
-        print("*** Adding dependencies to the artifact output...")
-        build_utils.copyFiles(self.args.dependencies_dir, depsGatherPath)
+        printMessage("*** Adding dependencies to the artifact output...")
+        dependenciesDir = self.getDependenciesDir(compiler)
+        build_utils.copyFiles(dependenciesDir, depsGatherPath, store)
         for src, dst in [("bin", "bin"), ("include", "include"), ("lib/dynamic", "lib")]:
             doCopy(
-                os.path.join(self.args.dependencies_dir, src),
-                os.path.join(depsGatherPath, dst))
-
-        for extraFile in ["README.md", "COPYING"]:
-            shutil.copy2(os.path.join(self.srcDir, extraFile), depsGatherPath)
+                os.path.join(dependenciesDir, src),
+                os.path.join(depsGatherPath, dst), store=store)
 
-        os.chdir(self.artifactsUnarchivedPath)
+        # both archives are produced from a single pass over the gathered artifacts
+        archives = []
         if self.shouldBuildPyCEGUI(compiler):
-            artifactWithPyCEGUIZipName = artifactZipNamePrefix + "-pycegui.zip"
-            build_utils.makeZip([artifactDirName], artifactWithPyCEGUIZipName, [".*\\.ilk", "PyCEGUI.*\\.pdb"])
-            shutil.move(artifactWithPyCEGUIZipName, os.path.join(self.artifactsPath, artifactWithPyCEGUIZipName))
-
-        artifactZipName = artifactZipNamePrefix + ".zip"
-        build_utils.makeZip([artifactDirName], artifactZipName, [".*\\.ilk", "PyCEGUI.*"])
-        shutil.move(artifactZipName, os.path.join(self.artifactsPath, artifactZipName))
-
-        print("*** Done gathering artifacts for CEGUI.")
+            archives.append(ArchiveSpec(os.path.join(self.artifactsPath, artifactZipNamePrefix + "-pycegui.zip"),
+                                        pathFilter=build_utils.ignorePatterns(
+                                            *self.getArchiveExcludes("*.ilk", "PyCEGUI*.pdb"))))
+        zipName = os.path.join(self.artifactsPath, artifactZipNamePrefix + ".zip")
+        archives.append(ArchiveSpec(zipName, pathFilter=build_utils.ignorePatterns(
+            *self.getArchiveExcludes("*.ilk", "PyCEGUI*"))))
+        # the PyCEGUI symbols were never shipped
+        self.packageArtifacts(compiler, [artifactDirName], archives, self.getSymbolsSpec(zipName, excludeFiles=["PyCEGUI*"]))
+
+        printMessage("*** Done gathering artifacts for CEGUI.")
+
+    def getRemoteOutputDirs(self, build):
+        return ["bin", "lib", "include", "cegui/include", "datafiles/samples", "doc/doxygen/html"]
+
+    # the documentation is taken from the first build of each toolchain (see onAfterBuild)
+    def getRemoteDoxygenDirs(self, build):
+        return ["doc/doxygen"] if build is self.builds[build.compiler][0] else []
+
+    def getArchiveNames(self, compiler):
+        names = ["cegui-sdk-%s.zip" % compiler]
+        if self.shouldBuildPyCEGUI(compiler):
+            names.insert(0, "cegui-sdk-%s-pycegui.zip" % compiler)
+        if self.args.debug_symbols == "archive":
+            names.append(os.path.basename(debug_symbols.getSymbolArchivePath(names[-1])))
+        return names
 
+    # the documentation doesn't depend on the toolchain, so it's generated only once per run
     def onAfterBuild(self, compiler, builds):
-        self.compileDocumentation(builds[0])
+        if self.documentationDir is None:
+            self.documentationDir = self.compileDocumentation(builds[0])
 
+    # returns the directory containing the generated HTML documentation, which is either taken from the
+    # documentation cache or generated by doxygen (and then cached)
     def compileDocumentation(self, build):
+        # generated by the worker, which has the doxyfile matching its build tree
+        if self.remoteBuilder is not None:
+            generatedDocDir = os.path.join(self.getDoxyfileDir(build), "html")
+            if not os.path.isdir(generatedDocDir):
+                printMessage("*** The build worker generated no documentation, the SDK won't have any!")
+                return None
+            return generatedDocDir
+
         hasDoxygen = self.hasExe('doxygen')
         hasDot = self.hasExe('dot')
 
         if not hasDoxygen:
-            print("*** No doxygen executable exists in PATH, will NOT generate documentation!")
-            return
+            printMessage("*** No doxygen executable exists in PATH, will NOT generate documentation!")
+            return None
 
         if not hasDot:
-            print("*** No dot executable exists in PATH, will NOT generate images for documentation!")
-
-        self.invokeDoxygen(self.getDoxyfileDir(build))
+            printMessage("*** No dot executable exists in PATH, will NOT generate images for documentation!")
+
+        doxyfileDir = self.getDoxyfileDir(build)
+        generatedDocDir = os.path.join(doxyfileDir, "html")
+        if self.args.no_documentation_cache or not os.path.isfile(os.path.join(doxyfileDir, "doxyfile")):
+            self.invokeDoxygen(doxyfileDir)
+            return generatedDocDir
+
+        cachedDocDir = os.path.join(self.cacheDir, "docs", self.getDocumentationKey(build, hasDot), "html")
+        if os.path.isdir(cachedDocDir):
+            printMessage("*** Headers and doxyfile unchanged, reusing the cached documentation from '%s'." %
+                         cachedDocDir)
+            # the entry's mtime is its last use
+            os.utime(os.path.dirname(cachedDocDir), None)
+            return cachedDocDir
+
+        if self.invokeDoxygen(doxyfileDir) == 0 and os.path.isdir(generatedDocDir):
+            # copied next to its final location and then renamed, so an interrupted copy is never used
+            tempDocDir = cachedDocDir + ".tmp"
+            build_utils.setupPath(tempDocDir)
+            build_utils.copytree(generatedDocDir, tempDocDir)
+            os.rename(tempDocDir, cachedDocDir)
+            self.pruneDocumentationCache()
+        return generatedDocDir
+
+    def pruneDocumentationCache(self):
+        docsDir = os.path.join(self.cacheDir, "docs")
+        entries = sorted(((os.path.getmtime(os.path.join(docsDir, name)), name) for name in os.listdir(docsDir)
+                          if os.path.isdir(os.path.join(docsDir, name))), reverse=True)
+        for _, name in entries[DOCUMENTATION_CACHE_ENTRIES:]:
+            printMessage("*** Removing the old cached documentation '%s' ..." % name)
+            shutil.rmtree(os.path.join(docsDir, name), ignore_errors=True)
+
+    # the documentation generated by a previous run, if any
+    def findDocumentationDir(self, build):
+        doxyfileDir = self.getDoxyfileDir(build)
+        if not self.args.no_documentation_cache and os.path.isfile(os.path.join(doxyfileDir, "doxyfile")):
+            cachedDocDir = os.path.join(self.cacheDir, "docs", self.getDocumentationKey(build, self.hasExe('dot')),
+                                        "html")
+            if os.path.isdir(cachedDocDir):
+                return cachedDocDir
+
+        generatedDocDir = os.path.join(doxyfileDir, "html")
+        return generatedDocDir if os.path.isdir(generatedDocDir) else None
+
+    # the documentation only depends on the public headers, the doxyfile and whether dot is available
+    def getDocumentationKey(self, build, hasDot):
+        hasher = hashlib.sha256()
+        includeDir = os.path.join(self.srcDir, "cegui", "include")
+        for root, dirs, files in os.walk(includeDir):
+            dirs.sort()
+            for name in sorted(files):
+                path = os.path.join(root, name)
+                hasher.update(os.path.relpath(path, includeDir).replace(os.sep, '/').encode('utf-8'))
+                hasher.update(build_utils.hashFile(path).encode('ascii'))
+
+        # the doxyfile is generated by CMake inside each build dir, whose path shouldn't matter
+        with open(os.path.join(self.getDoxyfileDir(build), "doxyfile"), 'rb') as f:
+            doxyfile = f.read()
+        buildDir = os.path.join(self.srcDir, build.buildDir)
+        for path in set([buildDir, buildDir.replace(os.sep, '/')]):
+            doxyfile = doxyfile.replace(path.encode('utf-8'), b"<build-dir>")
+        hasher.update(doxyfile)
+        hasher.update(b"dot" if hasDot else b"no-dot")
+
+        return hasher.hexdigest()
 
     @staticmethod
     def invokeDoxygen(doxyfileDir):
-        oldWorkingDirectory = os.getcwd()
-        os.chdir(doxyfileDir)
-
-        print("*** Invoking doxygen on folder '%s' ..." % doxyfileDir)
+        printMessage("*** Invoking doxygen on folder '%s' ..." % doxyfileDir)
         doxygenCommand = ["doxygen", os.path.join(doxyfileDir, "doxyfile")]
-        doxygenProc = subprocess.Popen(doxygenCommand).wait()
-        print("*** Doxygen return code:", doxygenProc)
-
-        os.chdir(oldWorkingDirectory)
+        returnCode = waitForProcess(subprocess.Popen(doxygenCommand, cwd=doxyfileDir))
+        printMessage("*** Doxygen return code:", returnCode)
+        return returnCode
 
     def getDoxyfileDir(self, build):
         return os.path.join(self.srcDir, build.buildDir, "doc", "doxygen")
 
-    def getDefaultCMakeArgs(self):
+    def getDefaultCMakeArgs(self, toolchain):
         args = ["-DCMAKE_PREFIX_PATH=" +
-                self.args.dependencies_dir,
+                self.getDependenciesDir(toolchain),
                 "-DCEGUI_SAMPLES_ENABLED=TRUE",
                 "-DCEGUI_BUILD_LUA_GENERATOR=FALSE",
                 "-DCEGUI_BUILD_LUA_MODULE=FALSE",
                 "-DCEGUI_BUILD_TESTS=FALSE",
                 "-DCEGUI_SAMPLE_DATAPATH=../datafiles"]
 
-        if self.shouldBuildPyCEGUI(self.toolchain):
+        if self.shouldBuildPyCEGUI(toolchain):
             args.extend(["-DBoost_INCLUDE_DIR=" + self.args.boost_include_dir,
                          "-DBoost_LIBRARY_DIR=" + self.args.boost_library_dir])
 
         args.append("-DCEGUI_BUILD_PYTHON_MODULES=" +
-                    ("TRUE" if self.shouldBuildPyCEGUI(self.toolchain) else "FALSE"))
+                    ("TRUE" if self.shouldBuildPyCEGUI(toolchain) else "FALSE"))
 
         return args
 
@@ -133,35 +260,26 @@ class CEGUISDK(SDKBuilder):
         return compiler == "msvc2008" and\
             self.args.boost_include_dir is not None and self.args.boost_library_dir is not None
 
-    def createSDKBuilds(self):
-        builds = collections.defaultdict(list)
-        configs = ["Debug", "RelWithDebInfo"]
-        cmakeGenerator = self.getCMakeGenerator(self.toolchain)
-
-        if self.toolchain == "mingw":
-            for config in configs:
-                cmakeArgs = ["-DCMAKE_BUILD_TYPE=" + config] + self.getDefaultCMakeArgs()
-                builds["mingw"].append(
-                    BuildDetails("mingw", "build-mingw-" + config,
-                                 CMakeArgs(cmakeGenerator, cmakeArgs),
-                                 [build_utils.generateMingwMakeCommand()]))
-        else:
-            builds[self.toolchain].append(
-                BuildDetails(self.toolchain, "build-" + self.toolchain,
-                             CMakeArgs(cmakeGenerator, self.getDefaultCMakeArgs()),
-                             [build_utils.generateMSBuildCommand("cegui.sln", config) for config in configs]))
-        return builds
+    def createToolchainBuilds(self, toolchain):
+        return self.createConfigBuilds(BuildDetails, toolchain, "", self.getDefaultCMakeArgs(toolchain),
+                                       self.getConfigs(CEGUI_CONFIGS), "cegui")
+
+    @classmethod
+    def getArgParse(cls):
+        parser = cls.getDefaultArgParse("cegui")
+        parser.add_argument("--no-documentation-cache", action="store_true",
+                            help="Always run doxygen, instead of reusing the documentation generated by a previous "
+                                 "run from the same headers and doxyfile")
+        parser.add_argument("-d", "--dependencies-dir", required=True,
+                            help="Directory where to find CEGUI dependencies associated with currently selected toolchain. "
+                                 "When building for multiple toolchains, '%s' is replaced by each toolchain name."
+                                 % TOOLCHAIN_PLACEHOLDER.replace("%", "%%"))
+        parser.add_argument("--boost-include-dir", default=None,
+                            help="Boost include dir")
+        parser.add_argument("--boost-library-dir", default=None,
+                            help="Boost library dir")
+        return parser
 
 if __name__ == "__main__":
-    currentPath = os.getcwd()
-
-    parser = SDKBuilder.getDefaultArgParse("cegui")
-    parser.add_argument("-d", "--dependencies-dir", required=True,
-                        help="Directory where to find CEGUI dependencies associated with currently selected toolchain")
-    parser.add_argument("--boost-include-dir", default=None,
-                        help="Boost include dir")
-    parser.add_argument("--boost-library-dir", default=None,
-                        help="Boost library dir")
-
-    ceguiSDK = CEGUISDK(parser.parse_args())
+    ceguiSDK = CEGUISDK(CEGUISDK.getArgParse().parse_args())
     ceguiSDK.build()
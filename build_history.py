@@ -0,0 +1,141 @@
+##############################################################################
+#   CEGUI SDK Builder build history
+#
+#   Copyright (C) 2014-2016   Timotei Dolean <timotei21@gmail.com>
+#                             and contributing authors (see AUTHORS file)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+##############################################################################
+from __future__ import print_function
+
+import json
+import platform
+import time
+
+DEFAULT_HISTORY_SETTINGS = {
+    "baselineRuns": 5,
+    "maxPhaseSlowdown": 0.2,
+    "minPhaseSlowdownSeconds": 10.0,
+    "maxArtifactGrowth": 0.1
+}
+
+# the steps which are too numerous to be tracked individually
+UNTRACKED_STEP_CATEGORIES = ["copy"]
+
+
+def median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2.0
+
+
+RUN_SUCCEEDED = "succeeded"
+RUN_FAILED = "failed"
+
+
+# the record of a single toolchain, from the spans attributed to it
+def createRunRecord(sdkName, toolchain, tracer, artifacts, status=RUN_SUCCEEDED):
+    spans = [span for span in tracer.spans if span.toolchain == toolchain]
+    phases = dict((category, total["wallTime"]) for category, total in tracer.getCategoryTotals(spans).items())
+    steps = {}
+    for span in spans:
+        if span.category not in UNTRACKED_STEP_CATEGORIES:
+            steps[span.name] = steps.get(span.name, 0.0) + span.wallTime
+
+    return {"time": time.time(), "host": platform.node(), "sdk": sdkName, "toolchain": toolchain,
+            "status": status, "phases": phases, "steps": steps, "artifacts": artifacts}
+
+
+# An append-only JSON lines file with one record per toolchain built by each builder run
+class BuildHistory:
+    def __init__(self, path):
+        self.path = path
+
+    def append(self, record):
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(record, sort_keys=True) + "\n")
+
+    # the succeeded runs only, the failed ones (often cut short) would skew the baseline
+    def load(self, sdkName, toolchain):
+        records = []
+        try:
+            with open(self.path, 'r') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    if record.get("sdk") == sdkName and record.get("toolchain") == toolchain and \
+                            record.get("status", RUN_SUCCEEDED) == RUN_SUCCEEDED:
+                        records.append(record)
+        except (IOError, OSError):
+            pass
+        return records
+
+
+# the median duration of every step over the last runs, which estimates how long the next run of each step takes
+def getStepEstimates(previousRecords, runs):
+    durations = {}
+    for record in previousRecords[-runs:]:
+        for step, duration in record.get("steps", {}).items():
+            durations.setdefault(step, []).append(duration)
+    return dict((step, median(stepDurations)) for step, stepDurations in durations.items())
+
+
+# Compares a run against the median of the previous ones, returning a description of every regression
+def findRegressions(record, previousRecords, settings):
+    baseline = previousRecords[-settings["baselineRuns"]:]
+    if not baseline:
+        return []
+
+    regressions = []
+    for phase, duration in sorted(record["phases"].items()):
+        durations = [r["phases"][phase] for r in baseline if phase in r.get("phases", {})]
+        if not durations:
+            continue
+
+        baselineDuration = median(durations)
+        if duration - baselineDuration >= settings["minPhaseSlowdownSeconds"] and \
+                duration > baselineDuration * (1.0 + settings["maxPhaseSlowdown"]):
+            regressions.append("phase '%s' took %.1fs, baseline is %.1fs (+%.0f%%)" % (
+                phase, duration, baselineDuration, 100.0 * (duration / baselineDuration - 1.0)))
+
+    for artifact, details in sorted(record["artifacts"].items()):
+        sizes = [r["artifacts"][artifact]["size"] for r in baseline if artifact in r.get("artifacts", {})]
+        if not sizes:
+            continue
+
+        baselineSize = median(sizes)
+        if baselineSize > 0 and details["size"] > baselineSize * (1.0 + settings["maxArtifactGrowth"]):
+            regressions.append("artifact '%s' is %.2f MB (%d files), baseline is %.2f MB (+%.0f%%)" % (
+                artifact, details["size"] / 1048576.0, details["files"], baselineSize / 1048576.0,
+                100.0 * (details["size"] / float(baselineSize) - 1.0)))
+
+    return regressions
+
+
+def printComparisonReport(record, previousRecords, settings):
+    baselineRuns = len(previousRecords[-settings["baselineRuns"]:])
+    if baselineRuns == 0:
+        print("*** No previous runs of '%s' with '%s' to compare against." % (record["sdk"], record["toolchain"]))
+        return
+
+    regressions = findRegressions(record, previousRecords, settings)
+    print("*** Comparison against the median of the previous %d run(s):" % baselineRuns)
+    if not regressions:
+        print("    no regressions found.")
+    for regression in regressions:
+        print("    REGRESSION:", regression)
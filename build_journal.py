@@ -0,0 +1,81 @@
+##############################################################################
+#   CEGUI SDK Builder step journal
+#
+#   Copyright (C) 2014-2016   Timotei Dolean <timotei21@gmail.com>
+#                             and contributing authors (see AUTHORS file)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+##############################################################################
+import hashlib
+import json
+import os
+import threading
+import time
+
+STEP_RUNNING = "running"
+STEP_COMPLETE = "complete"
+STEP_FAILED = "failed"
+
+
+def computeStepFingerprint(*inputs):
+    hasher = hashlib.sha256()
+    for value in inputs:
+        hasher.update(json.dumps(value, sort_keys=True).encode('utf-8'))
+        hasher.update(b'\0')
+    return hasher.hexdigest()
+
+
+# Persistent record of the steps of a builder run (configure, build, document, gather and zip, with the
+# same names as their trace spans), their status and the fingerprint of their inputs. It's written after
+# every change, so it survives the builder dying at any point.
+class StepJournal:
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.steps = self.load()
+
+    def load(self):
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f).get("steps", {})
+        except (IOError, OSError, ValueError):
+            return {}
+
+    def save(self):
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        tempPath = self.path + ".tmp"
+        with open(tempPath, 'w') as f:
+            json.dump({"steps": self.steps}, f, indent=1, sort_keys=True)
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        os.rename(tempPath, self.path)
+
+    def isComplete(self, stepId, fingerprint):
+        with self.lock:
+            entry = self.steps.get(stepId)
+        return entry is not None and entry["status"] == STEP_COMPLETE and entry["fingerprint"] == fingerprint
+
+    def setStatus(self, stepId, fingerprint, status):
+        with self.lock:
+            self.steps[stepId] = {"status": status, "fingerprint": fingerprint, "time": time.time()}
+            self.save()
+
+    def begin(self, stepId, fingerprint):
+        self.setStatus(stepId, fingerprint, STEP_RUNNING)
+
+    def end(self, stepId, fingerprint, succeeded):
+        self.setStatus(stepId, fingerprint, STEP_COMPLETE if succeeded else STEP_FAILED)
@@ -0,0 +1,255 @@
+##############################################################################
+#   CEGUI SDK Builder build output capture
+#
+#   Copyright (C) 2014-2016   Timotei Dolean <timotei21@gmail.com>
+#                             and contributing authors (see AUTHORS file)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+##############################################################################
+from __future__ import print_function
+
+import collections
+import gzip
+import os
+import re
+import subprocess
+import sys
+import threading
+from build_trace import ChildProcessTimer
+
+# a single line longer than this is split, so a child never printing a newline can't exhaust the memory
+MAX_LINE_LENGTH = 64 * 1024
+DEFAULT_LOG_PART_SIZE = 64 * 1024 * 1024
+DEFAULT_LOG_PARTS = 4
+MAX_KEPT_ERRORS = 20
+MAX_KEPT_WARNING_CODES = 100
+MAX_KEPT_PROJECTS = 1000
+TAIL_LINES = 30
+# how long to keep reading the output once the command exited: a process it left running in the background
+# (like an MSBuild node) can hold its pipes open forever
+OUTPUT_DRAIN_TIMEOUT = 10
+
+# file(line[,column]): error C2065: message  (MSVC and MSBuild)
+MSVC_DIAGNOSTIC = re.compile(r"^\s*(?:\d+>)?(?P<location>.*?)\s*:\s*(?:fatal\s+)?(?P<kind>error|warning)\s+"
+                             r"(?P<code>[A-Z]+\d+)\s*:\s*(?P<message>.*)$")
+# file:line:column: error: message  (GCC and Clang)
+GCC_DIAGNOSTIC = re.compile(r"^(?P<location>[^\s:][^:]*:\d+(?::\d+)?):\s*(?:fatal\s+)?(?P<kind>error|warning):\s*"
+                            r"(?P<message>.*?)(?:\s+\[(?P<code>-W[\w=-]+)\])?$")
+OTHER_ERROR = re.compile(r"^(?:\S*make(?:\.exe)?(?:\[\d+\])?: \*\*\*|CMake Error|LINK : fatal error|collect2: error)")
+# the MSBuild performance summary (/clp:PerformanceSummary), e.g. "     1234 ms  CEGUIBase.vcxproj   1 calls"
+PROJECT_TIMING = re.compile(r"^\s*(?P<ms>\d+)\s+ms\s+(?P<project>\S.*?\.\w*proj)\s+\d+\s+calls?\s*$", re.IGNORECASE)
+TIME_ELAPSED = re.compile(r"^\s*Time Elapsed (?P<hours>\d+):(?P<minutes>\d+):(?P<seconds>[\d.]+)\s*$")
+
+# Several builds and the post-build steps run at the same time, each on its own thread, so their messages go
+# through printMessage (or take printLock) to reach the console as whole lines.
+printLock = threading.Lock()
+
+
+def printMessage(*args):
+    with printLock:
+        print(*args)
+        sys.stdout.flush()
+
+
+# Gzip compressed log, split in parts of at most partSize (uncompressed) bytes, of which maxParts are kept:
+# the first one (with the configuration of the build and usually its first errors) and the last ones. A part
+# following dropped ones starts with a note saying so.
+class RotatingGzipLog:
+    def __init__(self, basePath, partSize=DEFAULT_LOG_PART_SIZE, maxParts=DEFAULT_LOG_PARTS):
+        self.basePath = basePath
+        self.partSize = partSize
+        self.maxParts = max(2, maxParts)
+        self.part = 0
+        self.partBytes = 0
+        self.file = None
+
+        directory = os.path.dirname(basePath)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        # the parts of a previous run
+        baseName = os.path.basename(basePath)
+        for name in os.listdir(directory or "."):
+            if name.startswith(baseName) and re.match(r"^\.(\d+\.)?log\.gz$", name[len(baseName):]):
+                os.remove(os.path.join(directory, name))
+        self.open()
+
+    def getPartPath(self, part):
+        return "%s.log.gz" % self.basePath if part == 0 else "%s.%d.log.gz" % (self.basePath, part)
+
+    def open(self):
+        self.file = gzip.open(self.getPartPath(self.part), 'wb')
+        self.partBytes = 0
+
+    def write(self, data):
+        if self.partBytes + len(data) > self.partSize and self.partBytes > 0:
+            self.file.close()
+            self.part += 1
+            droppedPart = self.part - self.maxParts + 1
+            if droppedPart >= 1:
+                os.remove(self.getPartPath(droppedPart))
+            self.open()
+            if droppedPart >= 1:
+                note = ("[log] Earlier parts of this output were dropped to bound the size of the log, only the first "
+                        "one (%s) and the last ones are kept.\n" % os.path.basename(self.getPartPath(0)))
+                self.file.write(note.encode('utf-8'))
+                self.partBytes += len(note)
+        self.file.write(data)
+        self.partBytes += len(data)
+
+    def close(self):
+        self.file.close()
+
+    def getPaths(self):
+        return [self.getPartPath(part) for part in [0] + list(range(max(1, self.part - self.maxParts + 2),
+                                                                    self.part + 1))]
+
+
+# Streaming parser of compiler and build tool output, keeping only bounded summaries
+class OutputSummary:
+    def __init__(self):
+        self.lines = 0
+        self.errorCount = 0
+        self.warningCount = 0
+        self.errors = []
+        self.warningCodes = collections.Counter()
+        self.projectTimes = {}
+        self.elapsedSeconds = None
+        self.tail = collections.deque(maxlen=TAIL_LINES)
+
+    def parseLine(self, line):
+        self.lines += 1
+        self.tail.append(line)
+
+        match = MSVC_DIAGNOSTIC.match(line) or GCC_DIAGNOSTIC.match(line)
+        if match is not None:
+            if match.group("kind") == "error":
+                self.addError(line)
+            else:
+                self.warningCount += 1
+                code = match.group("code") or "other"
+                if code in self.warningCodes or len(self.warningCodes) < MAX_KEPT_WARNING_CODES:
+                    self.warningCodes[code] += 1
+            return
+
+        if OTHER_ERROR.match(line):
+            self.addError(line)
+            return
+
+        match = PROJECT_TIMING.match(line)
+        if match is not None:
+            project = match.group("project")
+            if project in self.projectTimes or len(self.projectTimes) < MAX_KEPT_PROJECTS:
+                self.projectTimes[project] = self.projectTimes.get(project, 0.0) + int(match.group("ms")) / 1000.0
+            return
+
+        match = TIME_ELAPSED.match(line)
+        if match is not None:
+            self.elapsedSeconds = int(match.group("hours")) * 3600 + int(match.group("minutes")) * 60 + \
+                float(match.group("seconds"))
+
+    def addError(self, line):
+        self.errorCount += 1
+        if len(self.errors) < MAX_KEPT_ERRORS:
+            self.errors.append(line.strip())
+
+    def getSlowestProjects(self, count=10):
+        return sorted(self.projectTimes.items(), key=lambda item: item[1], reverse=True)[:count]
+
+    def toDict(self):
+        return {"lines": self.lines, "errors": self.errorCount, "warnings": self.warningCount,
+                "slowestProjects": self.getSlowestProjects()}
+
+    def printDigest(self, name, logPaths):
+        with printLock:
+            print("*** Failure digest for '%s': %d error(s), %d warning(s), %d line(s) of output." %
+                  (name, self.errorCount, self.warningCount, self.lines))
+            for error in self.errors:
+                print("    ", error)
+            if self.errorCount > len(self.errors):
+                print("     ... and %d more error(s)" % (self.errorCount - len(self.errors)))
+            if not self.errors:
+                print("*** No error was recognized, the last lines of the output were:")
+                for line in self.tail:
+                    print("    ", line)
+            print("*** Full output in:", ", ".join(logPaths))
+
+
+# Runs the command with its stdout and stderr going through pipes, which are drained by one thread each
+# (the only portable way to read pipes without blocking), into the log and the summary
+def runCommand(command, cwd, logBasePath, echo=False, env=None):
+    log = RotatingGzipLog(logBasePath)
+    summary = OutputSummary()
+    lock = threading.Lock()
+    logClosed = [False]
+
+    def drain(stream, prefix):
+        for data in iter(lambda: stream.readline(MAX_LINE_LENGTH), b""):
+            line = data.decode('utf-8', 'replace').rstrip("\r\n")
+            with lock:
+                if logClosed[0]:
+                    break
+                log.write(prefix + data if prefix else data)
+                summary.parseLine(line)
+            if echo:
+                with printLock:
+                    print(line)
+        stream.close()
+
+    try:
+        process = subprocess.Popen(command, cwd=cwd, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        timer = ChildProcessTimer(process)
+    except OSError as e:
+        log.close()
+        printMessage("*** Error running '%s': %s" % (" ".join(command), e))
+        return 1, summary, log.getPaths()
+
+    readers = [threading.Thread(target=drain, args=(process.stdout, b"")),
+               threading.Thread(target=drain, args=(process.stderr, b"[stderr] "))]
+    for reader in readers:
+        reader.daemon = True
+        reader.start()
+    returnCode = timer.wait()
+    for reader in readers:
+        reader.join(OUTPUT_DRAIN_TIMEOUT)
+        if reader.is_alive():
+            with printLock:
+                print("*** The output of '%s' is still open after it exited, probably held by a process it "
+                      "started; not waiting for it." % " ".join(command))
+            break
+    with lock:
+        logClosed[0] = True
+        log.close()
+
+    return returnCode, summary, log.getPaths()
+
+
+def getLogBasePath(logDir, buildDir, step):
+    return os.path.join(logDir, buildDir, re.sub(r"[^\w.-]+", "_", step))
+
+
+# the whole output of a build is only echoed when asked for, the console gets a one line summary instead
+def printCommandSummary(name, returnCode, summary, logPaths):
+    with printLock:
+        print("*** '%s' finished with return code %d: %d error(s), %d warning(s). Log: %s" %
+              (name, returnCode, summary.errorCount, summary.warningCount, logPaths[-1]))
+    sys.stdout.flush()
+
+
+# runs the command as runCommand does, printing its summary and, when it fails, its failure digest
+def runLoggedCommand(name, command, cwd, logBasePath, echo=False):
+    returnCode, summary, logPaths = runCommand(command, cwd, logBasePath, echo)
+    printCommandSummary(name, returnCode, summary, logPaths)
+    if returnCode != 0:
+        summary.printDigest(name, logPaths)
+    return returnCode, summary
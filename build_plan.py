@@ -0,0 +1,128 @@
+##############################################################################
+#   CEGUI SDK Builder dry-run planner
+#
+#   Copyright (C) 2014-2016   Timotei Dolean <timotei21@gmail.com>
+#                             and contributing authors (see AUTHORS file)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+##############################################################################
+from __future__ import print_function
+
+import json
+import os
+import build_history
+import build_utils
+
+
+# The steps a builder run would go through, named like their trace spans, with the steps each one waits for.
+# 'cached' is true for the steps which are predicted to be skipped (or to be nearly free), false for the
+# ones which will run and null when it can't be predicted before running the previous steps.
+class BuildPlan:
+    def __init__(self, estimates):
+        self.estimates = estimates
+        self.steps = []
+
+    def addStep(self, stepId, category, dependsOn, cached, **details):
+        self.steps.append({"id": stepId, "category": category, "dependsOn": dependsOn, "cached": cached,
+                           "estimatedSeconds": 0.0 if cached else self.estimates.get(stepId),
+                           "details": details})
+
+    # the longest chain of dependent steps, which bounds the run time however many builds run in parallel
+    def getCriticalPathSeconds(self):
+        finishTimes = {}
+        for step in self.steps:
+            startTime = max([finishTimes.get(dependency, 0.0) for dependency in step["dependsOn"]] + [0.0])
+            finishTimes[step["id"]] = startTime + (step["estimatedSeconds"] or 0.0)
+        return max(list(finishTimes.values()) + [0.0])
+
+    def toDict(self):
+        return {"steps": self.steps,
+                "estimates": {"serialSeconds": sum(step["estimatedSeconds"] or 0.0 for step in self.steps),
+                              "criticalPathSeconds": self.getCriticalPathSeconds(),
+                              "stepsWithoutEstimate": len([step for step in self.steps
+                                                           if step["estimatedSeconds"] is None])}}
+
+
+def createBuildPlan(sdk):
+    args = sdk.args
+    # the history has a record per toolchain, whose steps are named after the toolchain's builds
+    estimates = {}
+    historyRuns = {}
+    for toolchain in sdk.toolchains:
+        previousRecords = sdk.history.load(sdk.sdkName, toolchain)
+        historyRuns[toolchain] = len(previousRecords)
+        estimates.update(build_history.getStepEstimates(previousRecords, sdk.getHistorySettings()["baselineRuns"]))
+    plan = BuildPlan(estimates)
+    cmakeInputsHash = None if args.no_configure_cache else build_utils.hashCMakeInputs(sdk.srcDir)
+
+    plan.addStep("gather:shared", "gather", [], False)
+    for compiler, builds in sdk.builds.items():
+        toolchainCached = not args.force_build and sdk.isToolchainUpToDate(compiler, restore=False)
+        lastBuildSteps = {}
+
+        for build in builds:
+            buildDir = os.path.join(sdk.srcDir, build.buildDir)
+            buildCached = toolchainCached or sdk.isBuildCached(build)
+
+            configureCached = buildCached
+            if not configureCached and cmakeInputsHash is not None:
+                configureCached = build_utils.isConfigureUpToDate(buildDir, build_utils.computeConfigureFingerprint(
+                    cmakeInputsHash, build.cmakeArgs.generator, build.cmakeArgs.extraArgs,
+                    sdk.getToolchainDetails(compiler)))
+
+            previousStep = "configure:" + build.buildDir
+            plan.addStep(previousStep, "configure", [lastBuildSteps[id(dependency)] for dependency in build.dependencies
+                                                     if id(dependency) in lastBuildSteps],
+                         configureCached, generator=build.cmakeArgs.generator, cmakeArgs=build.cmakeArgs.extraArgs)
+
+            # the same conditions as SDKBuilder.runBuild
+            canResume = args.resume and not args.no_configure_cache and \
+                os.path.isfile(os.path.join(buildDir, "CMakeCache.txt"))
+            for index, (command, fingerprint) in enumerate(zip(build.buildCommands,
+                                                               sdk.getBuildStepFingerprints(build))):
+                stepId = "build:%s:%d" % (build.buildDir, index)
+                plan.addStep(stepId, "build", [previousStep],
+                             buildCached or (canResume and sdk.journal.isComplete(stepId, fingerprint)),
+                             command=command)
+                previousStep = stepId
+            lastBuildSteps[id(build)] = previousStep
+
+        postBuildFingerprint = sdk.getPostBuildFingerprint(compiler, builds)
+        postBuildSteps = [("document:" + compiler, "document", list(lastBuildSteps.values())),
+                          ("gather:" + compiler, "gather", ["document:" + compiler, "gather:shared"])]
+        for stepId, category, dependsOn in postBuildSteps:
+            plan.addStep(stepId, category, sorted(dependsOn), toolchainCached or
+                         (args.resume and sdk.journal.isComplete(stepId, postBuildFingerprint)))
+
+        archiveNames = sdk.getArchiveNames(compiler)
+        if archiveNames:
+            # whether the archives change is only known once the artifacts are gathered
+            plan.addStep("zip:" + ",".join(archiveNames), "zip", ["gather:" + compiler],
+                         True if toolchainCached else None, archives=archiveNames)
+
+    result = {"sdk": sdk.sdkName, "toolchains": sdk.toolchains, "parallelBuilds": sdk.parallelBuilds,
+              "jobsPerBuild": sdk.getJobsPerBuild(), "historyRuns": historyRuns}
+    result.update(plan.toDict())
+    return result
+
+
+def writeBuildPlan(sdk, path):
+    plan = createBuildPlan(sdk)
+    with open(path, 'w') as f:
+        json.dump(plan, f, indent=2)
+
+    print("*** Build plan with %d step(s) written to %s. Estimated time: %.1fs serial, %.1fs critical path "
+          "(%d step(s) without estimate)." % (len(plan["steps"]), path, plan["estimates"]["serialSeconds"],
+                                             plan["estimates"]["criticalPathSeconds"],
+                                             plan["estimates"]["stepsWithoutEstimate"]))
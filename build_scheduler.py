@@ -0,0 +1,129 @@
+##############################################################################
+#   CEGUI SDK Builder build scheduler
+#
+#   Copyright (C) 2014-2016   Timotei Dolean <timotei21@gmail.com>
+#                             and contributing authors (see AUTHORS file)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+##############################################################################
+from __future__ import print_function
+
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+from build_output import printMessage
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+
+def getJobsPerBuild(parallelBuilds):
+    return max(1, multiprocessing.cpu_count() // max(1, parallelBuilds))
+
+
+# the return code of the builds which weren't run because one of their dependencies failed
+DEPENDENCY_FAILED = -1
+
+
+# The builds themselves are external processes, so threads are enough to drive them concurrently.
+# A build is only started after all the builds in its 'dependencies' (if any) succeeded.
+class BuildScheduler:
+    def __init__(self, maxParallelBuilds):
+        self.maxParallelBuilds = max(1, maxParallelBuilds)
+
+    # returns a list of (build, returnCode) tuples, in the same order as the given builds. onBuildFinished
+    # is called on the calling thread as soon as each build finishes, in completion order
+    def run(self, builds, runBuild, onBuildFinished=None):
+        if len(builds) == 0:
+            return []
+
+        indices = dict((id(build), index) for index, build in enumerate(builds))
+        # dependencies which are not part of this run are considered satisfied
+        dependencies = [[indices[id(dependency)] for dependency in (getattr(build, "dependencies", None) or [])
+                         if id(dependency) in indices] for build in builds]
+        returnCodes = [None] * len(builds)
+        finishedBuilds = queue.Queue()
+
+        def runAndReport(index):
+            try:
+                finishedBuilds.put((index, runBuild(builds[index]), None))
+            except Exception as e:
+                finishedBuilds.put((index, None, e))
+
+        def finish(index, returnCode):
+            returnCodes[index] = returnCode
+            if onBuildFinished is not None:
+                onBuildFinished(builds[index], returnCode)
+
+        # starts the builds whose dependencies succeeded and skips the ones with failed dependencies,
+        # until nothing else can be started
+        def startReadyBuilds():
+            started = 0
+            progress = True
+            while progress:
+                progress = False
+                for index in list(pending):
+                    dependencyCodes = [returnCodes[dependency] for dependency in dependencies[index]]
+                    if [code for code in dependencyCodes if code is not None and code != 0]:
+                        printMessage("*** Skipping '%s' since some of its dependencies failed." %
+                                     getattr(builds[index], "buildDir", builds[index]))
+                        pending.remove(index)
+                        finish(index, DEPENDENCY_FAILED)
+                        progress = True
+                    elif None not in dependencyCodes:
+                        pending.remove(index)
+                        pool.apply_async(runAndReport, (index,))
+                        started += 1
+            return started
+
+        pending = list(range(len(builds)))
+        pool = ThreadPool(min(self.maxParallelBuilds, len(builds)))
+        try:
+            running = startReadyBuilds()
+            while running:
+                index, returnCode, error = finishedBuilds.get()
+                running -= 1
+                if error is not None:
+                    raise error
+                finish(index, returnCode)
+                running += startReadyBuilds()
+
+            if pending:
+                raise ValueError("The dependencies of the builds contain a cycle")
+        finally:
+            pool.close()
+            pool.join()
+
+        return list(zip(builds, returnCodes))
+
+
+# Runs the steps which come after the builds (documentation, gathering, packaging) on a background
+# thread, in submission order, so they overlap with the builds which are still running. Exceptions
+# raised by a step are re-raised by join().
+class PostBuildPipeline:
+    def __init__(self):
+        self.pool = ThreadPool(1)
+        self.pendingSteps = []
+
+    def submit(self, step, *args):
+        self.pendingSteps.append(self.pool.apply_async(step, args))
+
+    def join(self):
+        self.pool.close()
+        try:
+            for pendingStep in self.pendingSteps:
+                pendingStep.get()
+        finally:
+            self.pool.join()
@@ -0,0 +1,236 @@
+##############################################################################
+#   CEGUI SDK Builder build tracing
+#
+#   Copyright (C) 2014-2016   Timotei Dolean <timotei21@gmail.com>
+#                             and contributing authors (see AUTHORS file)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+##############################################################################
+from __future__ import print_function
+
+import collections
+import errno
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+if os.name == "nt":
+    import ctypes
+    from ctypes import wintypes
+
+    class JobObjectBasicAccountingInformation(ctypes.Structure):
+        _fields_ = [("TotalUserTime", ctypes.c_int64), ("TotalKernelTime", ctypes.c_int64),
+                    ("ThisPeriodTotalUserTime", ctypes.c_int64), ("ThisPeriodTotalKernelTime", ctypes.c_int64),
+                    ("TotalPageFaultCount", wintypes.DWORD), ("TotalProcesses", wintypes.DWORD),
+                    ("ActiveProcesses", wintypes.DWORD), ("TotalTerminatedProcesses", wintypes.DWORD)]
+
+    JOB_OBJECT_BASIC_ACCOUNTING_INFORMATION = 1
+    kernel32 = ctypes.WinDLL("kernel32", use_last_error=True)
+    kernel32.CreateJobObjectW.restype = wintypes.HANDLE
+    kernel32.CreateJobObjectW.argtypes = [ctypes.c_void_p, wintypes.LPCWSTR]
+    kernel32.AssignProcessToJobObject.argtypes = [wintypes.HANDLE, wintypes.HANDLE]
+    kernel32.QueryInformationJobObject.argtypes = [wintypes.HANDLE, ctypes.c_int, ctypes.c_void_p, wintypes.DWORD,
+                                                   ctypes.c_void_p]
+    kernel32.GetProcessTimes.argtypes = [wintypes.HANDLE] + [ctypes.POINTER(ctypes.c_uint64)] * 4
+    kernel32.CloseHandle.argtypes = [wintypes.HANDLE]
+
+# Windows counts CPU time in 100ns units
+WINDOWS_TIME_UNIT = 1e-7
+
+
+def exitStatusToReturnCode(status):
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+# Measures the CPU time (user and system) of one child process and of its descendants, so concurrent builds
+# are never charged each other's time. It has to be created right after starting the process. On POSIX the
+# resource usage comes from wait4, which accounts the descendants the child waited for (the compilers run
+# by make or ninja). On Windows the child is put in a job object, whose accounting covers every process
+# started in it (the compilers run by msbuild), with the child's own times as a fallback.
+class ChildProcessTimer:
+    def __init__(self, process):
+        self.process = process
+        self.job = None
+        if os.name == "nt":
+            self.job = kernel32.CreateJobObjectW(None, None)
+            if self.job and not kernel32.AssignProcessToJobObject(self.job, int(process._handle)):
+                # e.g. already in a job which doesn't allow nested ones (before Windows 8)
+                kernel32.CloseHandle(self.job)
+                self.job = None
+
+    # waits for the process, charges its CPU time to the current span and returns its return code
+    def wait(self):
+        if hasattr(os, "wait4"):
+            returnCode, cpuTime = self.waitPosix()
+        else:
+            returnCode = self.process.wait()
+            cpuTime = self.getWindowsCpuTime()
+        tracer.addChildCpuTime(cpuTime)
+        return returnCode
+
+    def waitPosix(self):
+        while True:
+            try:
+                _, status, usage = os.wait4(self.process.pid, 0)
+                break
+            except OSError as e:
+                if e.errno == errno.EINTR:
+                    continue
+                # somebody else reaped it
+                return self.process.wait(), 0.0
+
+        self.process.returncode = exitStatusToReturnCode(status)
+        return self.process.returncode, usage.ru_utime + usage.ru_stime
+
+    def getWindowsCpuTime(self):
+        if self.job is not None:
+            info = JobObjectBasicAccountingInformation()
+            succeeded = kernel32.QueryInformationJobObject(self.job, JOB_OBJECT_BASIC_ACCOUNTING_INFORMATION,
+                                                           ctypes.byref(info), ctypes.sizeof(info), None)
+            kernel32.CloseHandle(self.job)
+            self.job = None
+            if succeeded:
+                return (info.TotalUserTime + info.TotalKernelTime) * WINDOWS_TIME_UNIT
+
+        times = [ctypes.c_uint64() for _ in range(4)]
+        if not kernel32.GetProcessTimes(int(self.process._handle), *[ctypes.byref(t) for t in times]):
+            return 0.0
+        creationTime, exitTime, kernelTime, userTime = times
+        return (kernelTime.value + userTime.value) * WINDOWS_TIME_UNIT
+
+
+# waits for a process started outside of build_output, measuring it like the builds
+def waitForProcess(process):
+    return ChildProcessTimer(process).wait()
+
+
+class Span:
+    def __init__(self, name, category, threadId, args):
+        self.name = name
+        self.category = category
+        self.threadId = threadId
+        self.args = args
+        # the toolchain the span's work was done for, None for the toolchain independent work
+        self.toolchain = None
+        self.start = 0.0
+        self.wallTime = 0.0
+        self.childrenCpuTime = 0.0
+        self.bytesRead = 0
+        self.bytesWritten = 0
+
+    def addBytes(self, read=0, written=0):
+        self.bytesRead += read
+        self.bytesWritten += written
+
+
+class Tracer:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.spans = []
+        self.threadIds = {}
+        self.startTime = time.time()
+        # the spans open on each thread, the innermost one last
+        self.local = threading.local()
+
+    def getThreadId(self):
+        with self.lock:
+            return self.threadIds.setdefault(threading.current_thread().ident, len(self.threadIds) + 1)
+
+    def getOpenSpans(self):
+        if not hasattr(self.local, "spans"):
+            self.local.spans = []
+        return self.local.spans
+
+    # the spans opened by this thread in the block are attributed to the toolchain
+    @contextmanager
+    def toolchain(self, name):
+        previousToolchain = getattr(self.local, "toolchain", None)
+        self.local.toolchain = name
+        try:
+            yield
+        finally:
+            self.local.toolchain = previousToolchain
+
+    @contextmanager
+    def span(self, name, category, **args):
+        span = Span(name, category, self.getThreadId(), args)
+        span.toolchain = getattr(self.local, "toolchain", None)
+        span.start = time.time()
+        openSpans = self.getOpenSpans()
+        openSpans.append(span)
+        try:
+            yield span
+        finally:
+            openSpans.pop()
+            span.wallTime = time.time() - span.start
+            with self.lock:
+                self.spans.append(span)
+
+    # the child processes are charged to the innermost span open on the thread which waited for them
+    def addChildCpuTime(self, seconds):
+        openSpans = self.getOpenSpans()
+        if openSpans:
+            openSpans[-1].childrenCpuTime += seconds
+
+    def getCategoryTotals(self, spans=None):
+        totals = collections.OrderedDict()
+        for span in sorted(self.spans if spans is None else spans, key=lambda s: s.start):
+            total = totals.setdefault(span.category, {"count": 0, "wallTime": 0.0, "childrenCpuTime": 0.0,
+                                                      "bytesRead": 0, "bytesWritten": 0})
+            total["count"] += 1
+            total["wallTime"] += span.wallTime
+            total["childrenCpuTime"] += span.childrenCpuTime
+            total["bytesRead"] += span.bytesRead
+            total["bytesWritten"] += span.bytesWritten
+        return totals
+
+    # Chrome trace event format, loadable by chrome://tracing and https://ui.perfetto.dev
+    def writeChromeTrace(self, path):
+        events = []
+        for threadId in self.threadIds.values():
+            events.append({"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": threadId,
+                           "args": {"name": "thread-%d" % threadId if threadId > 1 else "main"}})
+
+        for span in self.spans:
+            args = dict(span.args)
+            args.update({"childrenCpuTime": span.childrenCpuTime, "bytesRead": span.bytesRead,
+                         "bytesWritten": span.bytesWritten})
+            events.append({"name": span.name, "cat": span.category, "ph": "X", "pid": os.getpid(),
+                           "tid": span.threadId, "ts": int((span.start - self.startTime) * 1e6),
+                           "dur": int(span.wallTime * 1e6), "args": args})
+
+        with open(path, 'w') as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+        print("*** Build trace written to", path)
+
+    def printSummary(self, slowestSpans=10):
+        print("*** Build phases summary:")
+        print("    %-12s %6s %12s %14s %12s %12s" % ("phase", "count", "wall (s)", "child cpu (s)", "read (MB)",
+                                                    "written (MB)"))
+        for category, total in self.getCategoryTotals().items():
+            print("    %-12s %6d %12.2f %14.2f %12.2f %12.2f" % (
+                category, total["count"], total["wallTime"], total["childrenCpuTime"],
+                total["bytesRead"] / 1048576.0, total["bytesWritten"] / 1048576.0))
+
+        print("*** Slowest steps:")
+        for span in sorted(self.spans, key=lambda s: s.wallTime, reverse=True)[:slowestSpans]:
+            print("    %10.2fs  %s" % (span.wallTime, span.name))
+
+
+# the concurrent builds and post-build steps of a run share this tracer, Tracer.lock makes it thread-safe
+tracer = Tracer()
@@ -19,51 +19,46 @@
 ##############################################################################
 from __future__ import print_function
 
-import fnmatch
+import hashlib
+import json
 import multiprocessing
 import os
 import subprocess
-import zipfile
 import shutil
-import re
+import threading
+from multiprocessing.pool import ThreadPool
+import build_output
+import sdk_packager
+from build_output import printMessage
+from build_trace import tracer, waitForProcess
+from path_filter import PathFilter
+
+try:
+    from os import scandir
+except ImportError:
+    # Python 2 only has it as a backport
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
 
 
 def setupPath(path, cleanExisting=True):
     if cleanExisting and os.path.isdir(path):
-        print("*** Cleaning up '%s' ... " % path)
+        printMessage("*** Cleaning up '%s' ... " % path)
         shutil.rmtree(path)
 
     if not os.path.exists(path):
-        print("*** Creating path '%s' ..." % path)
+        printMessage("*** Creating path '%s' ..." % path)
         os.makedirs(path)
 
 
-def makeZip(sources, zipName, patternsToIgnore=None):
-    def shouldIgnorePath(path):
-        for pattern in patternsToIgnore:
-            if re.match(pattern, path):
-                return True
+def makeZip(sources, zipName, patternsToIgnore=None, pathFilter=None):
+    sdk_packager.Packager().makeZips(sources, [sdk_packager.ArchiveSpec(zipName, patternsToIgnore, pathFilter)])
 
-        return False
-
-    if not patternsToIgnore:
-        patternsToIgnore = []
-    zipFile = zipfile.ZipFile(zipName, 'w', zipfile.ZIP_DEFLATED)
-    print("*** Creating zip archive in", zipName, "with sources", sources, "...")
-
-    for source in sources:
-        for root, dirs, files in os.walk(source):
-            if shouldIgnorePath(root):
-                continue
-
-            for file in files:
-                if not shouldIgnorePath(file):
-                    zipFile.write(os.path.join(root, file))
 
-    zipFile.close()
-
-
-def invokeCMake(sourceDir, generator, extraParams=None):
+# the output goes to the console, unless a log is given (see build_output.runCommand)
+def invokeCMake(sourceDir, generator, extraParams=None, buildDir=None, logBasePath=None, echo=False):
     if not extraParams:
         extraParams = []
 
@@ -71,73 +66,316 @@ def invokeCMake(sourceDir, generator, extraParams=None):
     cmakeCmd.extend(extraParams)
     cmakeCmd.append(sourceDir)
 
-    print("*** Invoking CMake '%s' ..." % cmakeCmd)
-    cmakeProc = subprocess.Popen(cmakeCmd).wait()
-    print("*** CMake generation return code:", cmakeProc)
+    printMessage("*** Invoking CMake '%s' ..." % cmakeCmd)
+    stepName = "configure:" + os.path.basename(buildDir or os.getcwd())
+    with tracer.span(stepName, "configure") as span:
+        if logBasePath is None:
+            cmakeProc = waitForProcess(subprocess.Popen(cmakeCmd, cwd=buildDir))
+        else:
+            cmakeProc, summary = build_output.runLoggedCommand(stepName, cmakeCmd, buildDir, logBasePath, echo)
+            span.args.update(summary.toDict())
+    printMessage("*** CMake generation return code:", cmakeProc)
     return cmakeProc
 
 
-def generateMSBuildCommand(filename, configuration):
-    return ["msbuild", filename, "/p:Configuration=" + configuration, "/maxcpucount", "/m", "/verbosity:minimal",
-            "/fl", "/flp:logfile=build%s.log" % configuration]
+CONFIGURE_STAMP_FILENAME = "sdk-builder-configure.json"
+
+
+def hashFile(path, blockSize=1024 * 1024):
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        block = f.read(blockSize)
+        while block:
+            hasher.update(block)
+            block = f.read(blockSize)
+    return hasher.hexdigest()
+
+
+def hashCMakeInputs(sourceDir):
+    return hashSourceTree(sourceDir, lambda name: name == "CMakeLists.txt" or name.endswith(".cmake"))
+
+
+# hashes the content of the files or, when contentHash is false, only their size and modification time
+def hashSourceTree(sourceDir, includeFile=None, excludeDirs=None, contentHash=True):
+    excludeDirs = set(os.path.normcase(os.path.abspath(d)) for d in (excludeDirs or []))
+    hasher = hashlib.sha256()
+    for root, dirs, files in os.walk(sourceDir):
+        # don't descend into build trees (which usually live inside the source dir) or VCS metadata
+        dirs[:] = sorted(d for d in dirs if not d.startswith('.') and
+                         not os.path.isfile(os.path.join(root, d, "CMakeCache.txt")) and
+                         os.path.normcase(os.path.join(root, d)) not in excludeDirs)
+
+        for name in sorted(files):
+            if includeFile is None or includeFile(name):
+                path = os.path.join(root, name)
+                hasher.update(os.path.relpath(path, sourceDir).replace(os.sep, '/').encode('utf-8'))
+                if contentHash:
+                    hasher.update(hashFile(path).encode('ascii'))
+                else:
+                    stat = os.stat(path)
+                    hasher.update(("%d:%f" % (stat.st_size, stat.st_mtime)).encode('ascii'))
+
+    return hasher.hexdigest()
+
+
+def computeConfigureFingerprint(cmakeInputsHash, generator, extraParams, toolchainDetails):
+    hasher = hashlib.sha256()
+    for value in [cmakeInputsHash, generator] + list(extraParams or []) + list(toolchainDetails):
+        hasher.update(value.encode('utf-8'))
+        hasher.update(b'\0')
+    return hasher.hexdigest()
 
 
-def generateMingwMakeCommand(target=None):
-    command = ["mingw32-make", "-j", str(multiprocessing.cpu_count())]
-    if target is not None:
-        command.append(target)
+def isConfigureUpToDate(buildDir, fingerprint):
+    if not os.path.isfile(os.path.join(buildDir, "CMakeCache.txt")):
+        return False
+
+    try:
+        with open(os.path.join(buildDir, CONFIGURE_STAMP_FILENAME), 'r') as f:
+            return json.load(f).get("fingerprint") == fingerprint
+    except (IOError, OSError, ValueError):
+        return False
+
+
+def saveConfigureFingerprint(buildDir, fingerprint):
+    with open(os.path.join(buildDir, CONFIGURE_STAMP_FILENAME), 'w') as f:
+        json.dump({"fingerprint": fingerprint}, f)
+
+
+def clearConfigureFingerprint(buildDir):
+    stampPath = os.path.join(buildDir, CONFIGURE_STAMP_FILENAME)
+    if os.path.isfile(stampPath):
+        os.remove(stampPath)
+
+
+def generateMSBuildCommand(filename, configuration, jobs=None, targets=None):
+    if jobs is None:
+        jobs = multiprocessing.cpu_count()
+    # the performance summary gives the time spent on each project; the worker nodes are not kept running
+    # after the build, they would hold its output pipes open
+    command = ["msbuild", filename, "/p:Configuration=" + configuration, "/maxcpucount:%d" % jobs, "/nodeReuse:false",
+               "/verbosity:minimal", "/clp:PerformanceSummary", "/fl", "/flp:logfile=build%s.log" % configuration]
+    if targets:
+        # the solution targets are named after the projects, with the dots replaced
+        command.append("/t:" + ";".join(target.replace(".", "_") for target in targets))
     return command
 
 
-def doCopy(src, dst, ignore=None):
-    print("*** From", src, "to", dst, "...")
+# the build command without its job count, which only changes how fast it builds and not what
+def getJobIndependentCommand(command):
+    result = []
+    skipNext = False
+    for arg in command:
+        if skipNext:
+            skipNext = False
+        elif arg == "-j":
+            skipNext = True
+        elif not arg.startswith("/maxcpucount:"):
+            result.append(arg)
+    return result
+
+
+def generateMingwMakeCommand(targets=None, jobs=None):
+    if jobs is None:
+        jobs = multiprocessing.cpu_count()
+    command = ["mingw32-make", "-j", str(jobs)]
+    if targets:
+        command.extend(targets)
+    return command
+
+
+def generateNinjaCommand(targets=None, jobs=None):
+    if jobs is None:
+        jobs = multiprocessing.cpu_count()
+    command = ["ninja", "-j", str(jobs)]
+    if targets:
+        command.extend(targets)
+    return command
+
+
+def doCopy(src, dst, ignore=None, store=None):
+    printMessage("*** From", src, "to", dst, "...")
     if not os.path.isdir(src):
-        print("*** ERROR: no", dir, "directory found as source, nothing will be copied!")
-        return
+        printMessage("*** ERROR: no", dir, "directory found as source, nothing will be copied!")
+        return CopyStats()
+
+    return doCopyPlan(planCopy(src, ignore), dst, store)
+
 
-    copytree(src, dst, ignore)
+def doCopyPlan(plan, dst, store=None):
+    with tracer.span("copy:" + dst, "copy") as span:
+        stats = executeCopy(plan, dst, store)
+        span.addBytes(stats.bytesCopied, stats.bytesCopied)
+    printMessage("*** %s" % stats)
+    return stats
 
 
 def ignoreNonMatchingFiles(*patterns):
-    def _ignore_patterns(path, names):
-        ignored_names = []
-        for pattern in patterns:
-            ignored_names.extend(set(names).difference(fnmatch.filter(names, pattern)))
-        return set(ignored_names)
-    return _ignore_patterns
+    return PathFilter(includeFiles=patterns)
 
 
-def copyFiles(src, dst):
-    if not os.path.exists(dst):
-        os.mkdir(dst)
+def ignorePatterns(*patterns):
+    return PathFilter(excludeFiles=patterns)
 
-    for item in os.listdir(src):
-        srcPath = os.path.join(src, item)
-        dstPath = os.path.join(dst, item)
 
-        if os.path.isdir(srcPath):
-            continue
+# files at least this big are copied on the thread pool, smaller ones are not worth the hand-off
+LARGE_FILE_SIZE = 4 * 1024 * 1024
+COPY_THREADS = 4
+
+
+class CopyStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.filesCopied = 0
+        self.bytesCopied = 0
+        self.filesSkipped = 0
+        self.bytesSkipped = 0
+
+    def add(self, size, copied):
+        with self.lock:
+            if copied:
+                self.filesCopied += 1
+                self.bytesCopied += size
+            else:
+                self.filesSkipped += 1
+                self.bytesSkipped += size
+
+    def __str__(self):
+        return "Copied %d file(s) (%.2f MB), skipped %d up to date file(s) (%.2f MB)." % \
+            (self.filesCopied, self.bytesCopied / 1048576.0, self.filesSkipped, self.bytesSkipped / 1048576.0)
+
+
+class _DirEntry:
+    def __init__(self, directory, name):
+        self.name = name
+        self.path = os.path.join(directory, name)
+
+    def is_dir(self):
+        return os.path.isdir(self.path)
+
+    def stat(self):
+        return os.stat(self.path)
+
+
+def listDir(path):
+    if scandir is not None:
+        return list(scandir(path))
+    return [_DirEntry(path, name) for name in os.listdir(path)]
+
+
+def isCopyUpToDate(srcPath, srcStat, dst, compareHash=False):
+    try:
+        dstStat = os.stat(dst)
+    except OSError:
+        return False
+
+    if dstStat.st_size != srcStat.st_size:
+        return False
+    # allow for the precision lost by filesystems (and Python 2) when copying the modification time
+    if abs(dstStat.st_mtime - srcStat.st_mtime) < 0.01:
+        return True
+    return compareHash and hashFile(srcPath) == hashFile(dst)
 
-        shutil.copy2(srcPath, dstPath)
 
+def copyFile(src, dst, store=None, stats=None, compareHash=False, srcStat=None):
+    if srcStat is None:
+        srcStat = os.stat(src)
 
-def copytree(src, dst, ignore=None):
-    names = os.listdir(src)
-    if ignore is not None:
-        ignored_names = ignore(src, names)
+    if isCopyUpToDate(src, srcStat, dst, compareHash):
+        copied = False
+    elif store is not None:
+        copied = store.materialize(src, dst)
     else:
-        ignored_names = set()
+        # never write through a link which may be shared with the artifact store
+        if os.path.isfile(dst) and os.stat(dst).st_nlink > 1:
+            os.remove(dst)
+        shutil.copy2(src, dst)
+        copied = True
+
+    if stats is not None:
+        stats.add(srcStat.st_size, copied)
+    return copied
 
-    if os.path.isdir(src) and not os.path.isdir(dst):
-        os.makedirs(dst)
 
-    for name in names:
-        srcname = os.path.join(src, name)
-        if not os.path.isdir(srcname) and name in ignored_names:
+def copyFiles(src, dst, store=None):
+    if not os.path.exists(dst):
+        os.mkdir(dst)
+
+    stats = CopyStats()
+    for entry in listDir(src):
+        if entry.is_dir():
             continue
 
-        dstname = os.path.join(dst, name)
-        if os.path.isdir(srcname):
-            copytree(srcname, dstname, ignore)
-        else:
-            shutil.copy2(srcname, dstname)
+        copyFile(entry.path, os.path.join(dst, entry.name), store, stats, srcStat=entry.stat())
+    return stats
+
+
+# The files (and directories) of a tree which should be copied, so the same tree can be copied to
+# multiple destinations while being walked only once
+class CopyPlan:
+    def __init__(self):
+        self.dirs = [""]
+        # (source path, path relative to the destination, source stat)
+        self.files = []
+
+    def addFile(self, srcPath, relPath):
+        self.files.append((srcPath, relPath, os.stat(srcPath)))
+
+
+def planCopy(src, ignore=None, plan=None, relPath=""):
+    if plan is None:
+        plan = CopyPlan()
+
+    entries = listDir(src)
+    if isinstance(ignore, PathFilter):
+        ignored_names = set(entry.name for entry in entries if ignore.isFileIgnored(entry.name))
+    elif ignore is not None:
+        ignored_names = ignore(src, [entry.name for entry in entries])
+    else:
+        ignored_names = set()
+
+    for entry in entries:
+        entryRelPath = os.path.join(relPath, entry.name)
+        if entry.is_dir():
+            if isinstance(ignore, PathFilter) and ignore.isDirPruned(entryRelPath):
+                continue
+            plan.dirs.append(entryRelPath)
+            planCopy(entry.path, ignore, plan, entryRelPath)
+        elif entry.name not in ignored_names:
+            plan.files.append((entry.path, entryRelPath, entry.stat()))
+
+    return plan
+
+
+# Copies the planned files under 'dst', skipping the ones which are already up to date (same size and
+# modification time or, when compareHash is set, same content) and copying the big ones in parallel.
+def executeCopy(plan, dst, store=None, compareHash=False):
+    for relPath in plan.dirs:
+        dirPath = os.path.join(dst, relPath)
+        if not os.path.isdir(dirPath):
+            os.makedirs(dirPath)
+
+    stats = CopyStats()
+    largeCopies = [copy for copy in plan.files if copy[2].st_size >= LARGE_FILE_SIZE]
+    pool = ThreadPool(COPY_THREADS) if largeCopies else None
+    try:
+        pendingCopies = [pool.apply_async(copyFile, (srcPath, os.path.join(dst, relPath), store, stats,
+                                                     compareHash, srcStat))
+                         for srcPath, relPath, srcStat in largeCopies] if pool is not None else []
+
+        for srcPath, relPath, srcStat in plan.files:
+            if srcStat.st_size < LARGE_FILE_SIZE:
+                copyFile(srcPath, os.path.join(dst, relPath), store, stats, compareHash, srcStat)
+
+        for pendingCopy in pendingCopies:
+            pendingCopy.get()
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    return stats
+
+
+def copytree(src, dst, ignore=None, store=None, compareHash=False):
+    return executeCopy(planCopy(src, ignore), dst, store, compareHash)
@@ -0,0 +1,205 @@
+##############################################################################
+#   CEGUI SDK Builder compiler cache support
+#
+#   Copyright (C) 2014-2016   Timotei Dolean <timotei21@gmail.com>
+#                             and contributing authors (see AUTHORS file)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+##############################################################################
+from __future__ import print_function
+
+import json
+import os
+import re
+import subprocess
+
+DEFAULT_COMPILER_CACHE_SETTINGS = {
+    "type": "none",
+    "executable": None,
+    "dir": None,
+    "maxSize": "10G"
+}
+
+SIZE_SUFFIXES = {"": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3, "T": 1024 ** 4}
+
+
+def parseSize(size):
+    match = re.match(r"^\s*(\d+(?:\.\d+)?)\s*([KMGT]?)i?B?\s*$", str(size), re.IGNORECASE)
+    if match is None:
+        raise ValueError("Invalid size '%s', expected something like '10G'" % size)
+    return int(float(match.group(1)) * SIZE_SUFFIXES[match.group(2).upper()])
+
+
+def isLauncherGenerator(generator):
+    # CMake only honors CMAKE_<LANG>_COMPILER_LAUNCHER with the Makefile and Ninja generators
+    return "Makefiles" in generator or "Ninja" in generator
+
+
+# A compiler cache wrapping every compiler invocation. Its cache directory and size limit are passed
+# through the environment, which the builds inherit.
+class CompilerCache:
+    name = None
+
+    def __init__(self, executable, cacheDir, maxSize):
+        self.executable = executable or self.name
+        self.cacheDir = cacheDir
+        self.maxSize = maxSize
+
+    def setup(self):
+        if not os.path.isdir(self.cacheDir):
+            os.makedirs(self.cacheDir)
+        os.environ.update(self.getEnvironment())
+        self.configure()
+        self.zeroStats()
+
+    def getEnvironment(self):
+        return {}
+
+    def configure(self):
+        pass
+
+    def getCMakeArgs(self, generator):
+        if not isLauncherGenerator(generator):
+            return []
+        return ["-DCMAKE_C_COMPILER_LAUNCHER=" + self.executable, "-DCMAKE_CXX_COMPILER_LAUNCHER=" + self.executable]
+
+    def getMSBuildArgs(self):
+        return []
+
+    def isSupported(self, generator):
+        return isLauncherGenerator(generator)
+
+    def invoke(self, *args):
+        try:
+            return subprocess.check_output([self.executable] + list(args)).decode('utf-8', 'replace')
+        except (OSError, subprocess.CalledProcessError) as e:
+            print("*** Error invoking '%s %s': %s" % (self.executable, " ".join(args), e))
+            return None
+
+    def zeroStats(self):
+        self.invoke("-z")
+
+    # returns a (hits, misses) tuple, or None when the statistics are not available
+    def getStats(self):
+        raise NotImplementedError
+
+    def printStats(self):
+        stats = self.getStats()
+        if stats is None:
+            print("*** No statistics available from the '%s' compiler cache." % self.name)
+            return
+
+        hits, misses = stats
+        total = hits + misses
+        print("*** Compiler cache (%s): %d hit(s), %d miss(es), %.1f%% hit rate." %
+              (self.name, hits, misses, 100.0 * hits / total if total else 0.0))
+
+
+class CCache(CompilerCache):
+    name = "ccache"
+
+    def getEnvironment(self):
+        return {"CCACHE_DIR": self.cacheDir}
+
+    def configure(self):
+        # a number without a suffix is read as gigabytes by ccache
+        self.invoke("--max-size=%dk" % (parseSize(self.maxSize) // 1024))
+
+    def getStats(self):
+        # machine readable since ccache 3.7, with one "<counter>\t<value>" per line
+        output = self.invoke("--print-stats")
+        if output is None:
+            return None
+
+        counters = {}
+        for line in output.splitlines():
+            parts = line.split("\t")
+            if len(parts) == 2 and parts[1].strip().isdigit():
+                counters[parts[0].strip()] = int(parts[1])
+        if "cache_miss" not in counters:
+            return None
+
+        return counters.get("direct_cache_hit", 0) + counters.get("preprocessed_cache_hit", 0), counters["cache_miss"]
+
+
+class SCCache(CompilerCache):
+    name = "sccache"
+
+    def getEnvironment(self):
+        # only read when the sccache server starts, which zeroing the statistics does
+        return {"SCCACHE_DIR": self.cacheDir, "SCCACHE_CACHE_SIZE": str(self.maxSize)}
+
+    def zeroStats(self):
+        self.invoke("--zero-stats")
+
+    def getStats(self):
+        output = self.invoke("--show-stats", "--stats-format=json")
+        if output is None:
+            return None
+
+        try:
+            stats = json.loads(output)["stats"]
+            return sum(stats["cache_hits"]["counts"].values()), sum(stats["cache_misses"]["counts"].values())
+        except (ValueError, KeyError, AttributeError):
+            return None
+
+
+# clcache replaces cl.exe itself, so it's plugged into MSBuild instead of CMake
+class ClCache(CompilerCache):
+    name = "clcache"
+
+    def getEnvironment(self):
+        return {"CLCACHE_DIR": self.cacheDir}
+
+    def configure(self):
+        self.invoke("-M", str(parseSize(self.maxSize)))
+
+    def getCMakeArgs(self, generator):
+        return []
+
+    def getMSBuildArgs(self):
+        executable = self.executable
+        if os.path.dirname(executable):
+            return ["/p:CLToolExe=" + os.path.basename(executable), "/p:CLToolPath=" + os.path.dirname(executable)]
+        return ["/p:CLToolExe=" + executable]
+
+    def isSupported(self, generator):
+        return generator.startswith("Visual Studio")
+
+    def getStats(self):
+        output = self.invoke("-s")
+        if output is None:
+            return None
+
+        hits = re.search(r"cache hits\s*:\s*(\d+)", output)
+        misses = re.search(r"cache misses\s*(?::\s*(\d+)|\n\s*total\s*:\s*(\d+))", output)
+        if hits is None or misses is None:
+            return None
+        return int(hits.group(1)), int(misses.group(1) or misses.group(2))
+
+
+COMPILER_CACHES = dict((cache.name, cache) for cache in [CCache, SCCache, ClCache])
+
+
+# settings is the 'compilerCache' entry of the config file; returns None when no cache should be used
+def createCompilerCache(settings, defaultCacheDir):
+    if settings["type"] in (None, "none"):
+        return None
+
+    if settings["type"] not in COMPILER_CACHES:
+        raise ValueError("Unknown compiler cache '%s', expected one of: %s" %
+                         (settings["type"], ", ".join(sorted(COMPILER_CACHES.keys()))))
+
+    cacheDir = os.path.abspath(settings["dir"] or os.path.join(defaultCacheDir, settings["type"]))
+    return COMPILER_CACHES[settings["type"]](settings["executable"], cacheDir, settings["maxSize"])
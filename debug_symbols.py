@@ -0,0 +1,118 @@
+##############################################################################
+#   CEGUI SDK Builder debug symbols handling
+#
+#   Copyright (C) 2014-2016   Timotei Dolean <timotei21@gmail.com>
+#                             and contributing authors (see AUTHORS file)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+##############################################################################
+from __future__ import print_function
+
+import json
+import multiprocessing
+import os
+import shutil
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+import build_utils
+from build_output import printMessage
+
+# bundled: the symbols stay in the SDK archives, archive: they go in a <name>-symbols.zip next to each
+# SDK archive, store: they go in the symbol store, indexed by file name and content hash
+DEBUG_SYMBOL_MODES = ["bundled", "archive", "store"]
+DEBUG_SYMBOL_PATTERNS = ["*.pdb"]
+
+
+def getSymbolArchivePath(zipName):
+    return os.path.splitext(zipName)[0] + "-symbols.zip"
+
+
+# A directory where each symbol file lives at <name>/<sha256>/<name>, so symbols of any number of builds can
+# be kept side by side and fetched only when needed (e.g. by a debugger, given the name and the hash).
+# index.json maps each name and hash to the SDKs which shipped it.
+class SymbolStore:
+    def __init__(self, rootDir, artifactStore=None):
+        self.rootDir = rootDir
+        self.indexPath = os.path.join(rootDir, "index.json")
+        self.artifactStore = artifactStore
+        self.lock = threading.Lock()
+
+        build_utils.setupPath(rootDir, False)
+        self.index = self.loadIndex()
+
+    def loadIndex(self):
+        try:
+            with open(self.indexPath, 'r') as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return {}
+
+    def save(self):
+        tmpPath = self.indexPath + ".tmp"
+        with open(tmpPath, 'w') as f:
+            json.dump(self.index, f, indent=1, sort_keys=True)
+        if os.path.exists(self.indexPath):
+            os.remove(self.indexPath)
+        os.rename(tmpPath, self.indexPath)
+
+    def getSymbolPath(self, name, digest):
+        return os.path.join(self.rootDir, name, digest, name)
+
+    def getDigest(self, path):
+        # the artifact store remembers the digests of the gathered files
+        if self.artifactStore is not None:
+            return self.artifactStore.getDigest(path)
+        return build_utils.hashFile(path)
+
+    def storeFile(self, path, digest):
+        symbolPath = self.getSymbolPath(os.path.basename(path), digest)
+        if os.path.exists(symbolPath):
+            return False
+
+        symbolDir = os.path.dirname(symbolPath)
+        if not os.path.isdir(symbolDir):
+            os.makedirs(symbolDir)
+        tmpPath = symbolPath + ".tmp"
+        if self.artifactStore is not None:
+            self.artifactStore.materialize(path, tmpPath)
+        else:
+            shutil.copy2(path, tmpPath)
+        os.rename(tmpPath, symbolPath)
+        return True
+
+    # files is a list of (path, relative path in the SDK) tuples, sdkName the SDK they were gathered for
+    def addFiles(self, files, sdkName):
+        pool = ThreadPool(multiprocessing.cpu_count())
+        try:
+            # hashing the (big) symbol files is what takes time, and hashlib releases the GIL while doing it
+            digests = pool.map(lambda fileDetails: self.getDigest(fileDetails[0]), files)
+        finally:
+            pool.close()
+            pool.join()
+
+        storedFiles = 0
+        with self.lock:
+            for (path, relPath), digest in zip(files, digests):
+                if self.storeFile(path, digest):
+                    storedFiles += 1
+
+                name = os.path.basename(path)
+                entry = self.index.setdefault(name, {}).setdefault(digest, {"size": os.path.getsize(path),
+                                                                            "sdks": {}})
+                entry["sdks"][sdkName] = {"path": relPath, "time": time.time()}
+            self.save()
+
+        printMessage("*** Symbol store '%s': %d new symbol file(s), %d already stored." %
+                     (self.rootDir, storedFiles, len(files) - storedFiles))
@@ -0,0 +1,71 @@
+##############################################################################
+#   CEGUI SDK Builder path filter
+#
+#   Copyright (C) 2014-2016   Timotei Dolean <timotei21@gmail.com>
+#                             and contributing authors (see AUTHORS file)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+##############################################################################
+import fnmatch
+import os
+import re
+
+
+def combinePatterns(globs, regexes=None):
+    # globs follow fnmatch's rules, so they are case insensitive on Windows
+    patterns = [fnmatch.translate(os.path.normcase(glob)) for glob in (globs or [])]
+    patterns.extend(regexes or [])
+    if not patterns:
+        return None
+
+    return re.compile("|".join("(?:%s)" % pattern for pattern in patterns))
+
+
+# Decides which files get copied or archived. Every kind of pattern is compiled once into a single
+# regular expression. File patterns are matched against file names, while directory patterns are
+# matched against the path relative to the walked root (and the directory name, for globs) and prune
+# the whole subtree.
+class PathFilter:
+    def __init__(self, includeFiles=None, excludeFiles=None, excludeFileRegexes=None,
+                 pruneDirs=None, pruneDirRegexes=None):
+        self.includeFilesMatcher = combinePatterns(includeFiles)
+        self.excludeFileGlobsMatcher = combinePatterns(excludeFiles)
+        self.excludeFileRegexesMatcher = combinePatterns(None, excludeFileRegexes)
+        self.pruneDirGlobsMatcher = combinePatterns(pruneDirs)
+        self.pruneDirRegexesMatcher = combinePatterns(None, pruneDirRegexes)
+
+    def isFileIgnored(self, name):
+        if self.includeFilesMatcher is not None and not self.includeFilesMatcher.match(os.path.normcase(name)):
+            return True
+
+        if self.excludeFileRegexesMatcher is not None and self.excludeFileRegexesMatcher.match(name):
+            return True
+
+        return self.excludeFileGlobsMatcher is not None and \
+            self.excludeFileGlobsMatcher.match(os.path.normcase(name)) is not None
+
+    def isDirPruned(self, relPath):
+        if self.pruneDirRegexesMatcher is not None and self.pruneDirRegexesMatcher.match(relPath):
+            return True
+
+        if self.pruneDirGlobsMatcher is not None:
+            normalizedPath = os.path.normcase(relPath)
+            return self.pruneDirGlobsMatcher.match(normalizedPath) is not None or \
+                self.pruneDirGlobsMatcher.match(os.path.basename(normalizedPath)) is not None
+
+        return False
+
+    # allows passing the filter everywhere an ignore callable of shutil.copytree is expected
+    def __call__(self, path, names):
+        return set(name for name in names if self.isFileIgnored(name))
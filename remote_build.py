@@ -0,0 +1,379 @@
+##############################################################################
+#   CEGUI SDK Builder remote build workers
+#
+#   Copyright (C) 2014-2016   Timotei Dolean <timotei21@gmail.com>
+#                             and contributing authors (see AUTHORS file)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+##############################################################################
+from __future__ import print_function
+
+import argparse
+import hmac
+import json
+import multiprocessing
+import os
+import posixpath
+import re
+import tarfile
+import build_output
+import build_utils
+import toolchains
+from build_output import printLock, printMessage
+
+try:
+    basestring
+except NameError:
+    basestring = str
+
+try:
+    import queue
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import parse_qs, urlencode, urlparse
+    from urllib.request import Request, urlopen
+except ImportError:
+    import Queue as queue
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urllib import urlencode
+    from urllib2 import Request, urlopen
+    from urlparse import parse_qs, urlparse
+
+# The protocol between the coordinator (the builder script) and the workers, over HTTP. Every request carries
+# the token shared by the coordinator and the worker in the X-Build-Token header, and is refused without it:
+#   GET  /info                            -> {"cores": <number of cores of the worker>}
+#   POST /build  (a JSON build request)   -> {"returnCode": ..., "steps": [{"name", "returnCode", "summary"}]}
+#   GET  /output?buildDir=...&dir=...     -> an uncompressed tar stream of the given dirs of the build tree
+# A build request has the 'buildDir', 'toolchain', 'generator', 'cmakeArgs', 'buildCommands' and
+# 'toolchainDetails' of a build, and how many builds ('parallelBuilds') the coordinator runs on the worker.
+# Its 'doxygenDirs' are the dirs of the build tree in which doxygen runs once the build succeeded, as the
+# doxyfiles CMake generates there point to the worker's tree.
+# The workers build in their own copy of the sources, so any path in the CMake arguments has to exist on the
+# worker as well. The only programs a worker runs are CMake and the build program of the requested toolchain.
+
+DEFAULT_WORKER_PORT = 8765
+TOKEN_HEADER = "X-Build-Token"
+SAFE_NAME = re.compile(r"^[\w.+-]+$")
+
+
+def readToken(path):
+    with open(path, 'r') as f:
+        token = f.read().strip()
+    if not token:
+        raise ValueError("The token file '%s' is empty" % path)
+    return token
+
+
+def isSafeRelPath(path):
+    parts = path.split("/")
+    return [part for part in parts if SAFE_NAME.match(part) and part not in (".", "..")] == parts
+
+
+# a symlink of the output (like the SONAME links of the shared libraries) may only point next to it, inside the
+# same output dir
+def isSafeLink(member, outputDirs):
+    if member.linkname.startswith("/") or "\\" in member.linkname:
+        return False
+    target = posixpath.normpath(posixpath.join(posixpath.dirname(member.name), member.linkname))
+    return isSafeRelPath(target) and \
+        [d for d in outputDirs if member.name.startswith(d + "/") and target.startswith(d + "/")] != []
+
+
+# writes the given dirs of the build tree to fileobj as an uncompressed tar stream, keeping the symlinks
+def writeOutput(fileobj, buildDir, dirs):
+    tar = tarfile.open(fileobj=fileobj, mode="w|")
+    try:
+        for d in dirs:
+            path = os.path.join(buildDir, *d.split("/"))
+            if os.path.exists(path):
+                tar.add(path, arcname=d)
+    finally:
+        tar.close()
+
+
+# extracts an output stream written by writeOutput into localBuildDir, returning how many files it contained
+def extractOutput(fileobj, localBuildDir, outputDirs):
+    extractedFiles = 0
+    tar = tarfile.open(fileobj=fileobj, mode="r|")
+    for member in tar:
+        if not isSafeRelPath(member.name) or not (member.isfile() or member.isdir() or
+                                                  (member.issym() and isSafeLink(member, outputDirs))):
+            raise tarfile.TarError("Unexpected entry '%s'" % member.name)
+
+        path = os.path.join(localBuildDir, *member.name.split("/"))
+        if member.isdir():
+            build_utils.setupPath(path, False)
+            continue
+        # never write through a link which may be shared with the artifact store
+        if os.path.islink(path) or os.path.isfile(path):
+            os.remove(path)
+        if hasattr(tarfile, "data_filter"):
+            tar.extract(member, localBuildDir, filter="data")
+        else:
+            tar.extract(member, localBuildDir)
+        extractedFiles += 1
+    tar.close()
+    return extractedFiles
+
+
+def isValidBuildCommand(command, toolchain):
+    return isinstance(command, list) and len(command) > 0 and \
+        len([arg for arg in command if isinstance(arg, basestring)]) == len(command) and \
+        command[0] == toolchain.buildProgram
+
+
+class WorkerRequestHandler(BaseHTTPRequestHandler):
+    def isAuthorized(self):
+        token = self.headers.get(TOKEN_HEADER) or ""
+        if hmac.compare_digest(token.encode('utf-8'), self.server.token.encode('utf-8')):
+            return True
+        self.sendJson(403, {"error": "Missing or wrong %s header" % TOKEN_HEADER})
+        return False
+
+    def sendJson(self, status, value):
+        body = json.dumps(value).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if not self.isAuthorized():
+            return
+
+        url = urlparse(self.path)
+        if url.path == "/info":
+            self.sendJson(200, {"cores": multiprocessing.cpu_count()})
+        elif url.path == "/output":
+            query = parse_qs(url.query)
+            buildDir = query.get("buildDir", [""])[0]
+            dirs = query.get("dir", [])
+            if not SAFE_NAME.match(buildDir) or [d for d in dirs if not isSafeRelPath(d)]:
+                self.sendJson(400, {"error": "Invalid build or output dir"})
+                return
+            self.sendOutput(os.path.join(self.server.srcDir, buildDir), dirs)
+        else:
+            self.sendJson(404, {"error": "Unknown request '%s'" % url.path})
+
+    def do_POST(self):
+        if not self.isAuthorized():
+            return
+        if urlparse(self.path).path != "/build":
+            self.sendJson(404, {"error": "Unknown request '%s'" % self.path})
+            return
+        if (self.headers.get("Content-Type") or "").split(";")[0].strip() != "application/json":
+            self.sendJson(415, {"error": "Expected an application/json build request"})
+            return
+
+        try:
+            request = json.loads(self.rfile.read(int(self.headers["Content-Length"])).decode('utf-8'))
+        except (TypeError, ValueError) as e:
+            self.sendJson(400, {"error": "Invalid build request: %s" % e})
+            return
+        if not SAFE_NAME.match(request.get("buildDir", "")):
+            self.sendJson(400, {"error": "Invalid build dir"})
+            return
+        if request.get("toolchain") not in toolchains.TOOLCHAINS or not isinstance(request.get("parallelBuilds"), int):
+            self.sendJson(400, {"error": "Invalid toolchain or parallel build count"})
+            return
+        toolchain = toolchains.getToolchain(request["toolchain"])
+        buildCommands = request.get("buildCommands")
+        if request.get("generator") != toolchain.generator or not isinstance(request.get("cmakeArgs"), list) or \
+                not isinstance(buildCommands, list) or \
+                [command for command in buildCommands if not isValidBuildCommand(command, toolchain)]:
+            self.sendJson(400, {"error": "Only '%s' builds with the %s generator are allowed" %
+                                         (toolchain.buildProgram, toolchain.generator)})
+            return
+        doxygenDirs = request.get("doxygenDirs", [])
+        if not isinstance(doxygenDirs, list) or \
+                [d for d in doxygenDirs if not isinstance(d, basestring) or not isSafeRelPath(d)]:
+            self.sendJson(400, {"error": "Invalid doxygen dirs"})
+            return
+
+        self.sendJson(200, self.server.runBuild(request))
+
+    # streamed as it's written, without knowing its size, so the connection is closed at the end
+    def sendOutput(self, buildDir, dirs):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-tar")
+        self.end_headers()
+        self.close_connection = True
+        writeOutput(self.wfile, buildDir, dirs)
+
+
+# every request is handled on its own thread, so a worker can run as many builds at once as the coordinator
+# sends (it sends one at a time per occurrence of the worker in its list)
+class BuildWorker(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, srcDir, logDir, token):
+        HTTPServer.__init__(self, address, WorkerRequestHandler)
+        self.srcDir = srcDir
+        self.logDir = logDir
+        self.token = token
+
+    # the same steps as SDKBuilder.configureBuild and SDKBuilder.runBuild, minus the journal
+    def runBuild(self, request):
+        buildDir = os.path.join(self.srcDir, request["buildDir"])
+        steps = []
+
+        fingerprint = build_utils.computeConfigureFingerprint(
+            build_utils.hashCMakeInputs(self.srcDir), request["generator"], request["cmakeArgs"],
+            request["toolchainDetails"])
+        if build_utils.isConfigureUpToDate(buildDir, fingerprint):
+            printMessage("*** CMake configuration of '%s' is up to date, reusing the existing build tree." %
+                         request["buildDir"])
+        else:
+            build_utils.setupPath(buildDir)
+            build_utils.clearConfigureFingerprint(buildDir)
+            hostArgs = toolchains.getToolchain(request["toolchain"]).getHostConfigureArgs(request["parallelBuilds"])
+            returnCode = build_utils.invokeCMake(self.srcDir, request["generator"], request["cmakeArgs"] + hostArgs,
+                                                 buildDir,
+                                                 build_output.getLogBasePath(self.logDir, request["buildDir"],
+                                                                             "configure"))
+            steps.append({"name": "configure:" + request["buildDir"], "returnCode": returnCode})
+            if returnCode != 0:
+                return {"returnCode": returnCode, "steps": steps}
+            build_utils.saveConfigureFingerprint(buildDir, fingerprint)
+
+        for index, command in enumerate(request["buildCommands"]):
+            stepName = "build:%s:%d" % (request["buildDir"], index)
+            printMessage("*** Executing compiler command:", command)
+            returnCode, summary = build_output.runLoggedCommand(
+                stepName, command, buildDir, build_output.getLogBasePath(self.logDir, request["buildDir"],
+                                                                         "build-%d" % index))
+            steps.append({"name": stepName, "returnCode": returnCode,
+                          "summary": dict(summary.toDict(), errorLines=summary.errors)})
+            if returnCode != 0:
+                return {"returnCode": returnCode, "steps": steps}
+
+        # as with local builds, the SDK is still packaged without documentation when doxygen fails
+        for d in request.get("doxygenDirs", []):
+            stepName = "document:%s:%s" % (request["buildDir"], d)
+            returnCode, summary = build_output.runLoggedCommand(
+                stepName, ["doxygen", "doxyfile"], os.path.join(buildDir, *d.split("/")),
+                build_output.getLogBasePath(self.logDir, request["buildDir"], "doxygen-" + d))
+            steps.append({"name": stepName, "returnCode": returnCode,
+                          "summary": dict(summary.toDict(), errorLines=summary.errors)})
+
+        return {"returnCode": 0, "steps": steps}
+
+
+# The coordinator side: hands each build to a free worker, waiting for one when they're all busy, and unpacks
+# the outputs it sends back into the local build tree, where the artifacts are gathered from as usual.
+class RemoteBuilder:
+    def __init__(self, workers, token):
+        self.workers = workers
+        self.token = token
+        self.freeWorkers = queue.Queue()
+        for worker in workers:
+            self.freeWorkers.put(worker)
+
+        self.cores = {}
+        for worker in set(workers):
+            try:
+                self.cores[worker] = self.request(worker, "/info")["cores"]
+            except (IOError, OSError, ValueError, KeyError) as e:
+                raise IOError("Can't reach the build worker '%s': %s" % (worker, e))
+
+    def request(self, worker, path, payload=None):
+        data = None if payload is None else json.dumps(payload).encode('utf-8')
+        request = Request("http://%s%s" % (worker, path), data,
+                          {"Content-Type": "application/json", TOKEN_HEADER: self.token})
+        response = urlopen(request)
+        try:
+            return json.loads(response.read().decode('utf-8'))
+        finally:
+            response.close()
+
+    # the cores of a worker are shared by the builds it runs at the same time
+    def getJobsPerBuild(self):
+        return max(1, min(cores // self.workers.count(worker) for worker, cores in self.cores.items()))
+
+    def runBuild(self, build, localBuildDir, outputDirs, doxygenDirs, toolchainDetails):
+        worker = self.freeWorkers.get()
+        try:
+            printMessage("*** Building '%s' on worker '%s' ..." % (build.buildDir, worker))
+            result = self.request(worker, "/build", {
+                "buildDir": build.buildDir, "toolchain": build.compiler, "parallelBuilds": self.workers.count(worker),
+                "generator": build.cmakeArgs.generator,
+                "cmakeArgs": build.cmakeArgs.extraArgs, "buildCommands": build.buildCommands,
+                "doxygenDirs": doxygenDirs,
+                "toolchainDetails": toolchainDetails})
+            self.printSteps(worker, result["steps"])
+            if result["returnCode"] != 0:
+                return result["returnCode"]
+
+            self.fetchOutput(worker, build.buildDir, localBuildDir, outputDirs)
+            return 0
+        except (IOError, OSError, ValueError, KeyError, tarfile.TarError) as e:
+            printMessage("*** Remote build of '%s' on worker '%s' failed: %s" % (build.buildDir, worker, e))
+            return 1
+        finally:
+            self.freeWorkers.put(worker)
+
+    def printSteps(self, worker, steps):
+        with printLock:
+            for step in steps:
+                summary = step.get("summary", {})
+                print("*** '%s' finished on '%s' with return code %d: %d error(s), %d warning(s)." %
+                      (step["name"], worker, step["returnCode"], summary.get("errors", 0), summary.get("warnings", 0)))
+                for error in summary.get("errorLines", []):
+                    print("    ", error)
+
+    def fetchOutput(self, worker, buildDir, localBuildDir, outputDirs):
+        query = urlencode([("buildDir", buildDir)] + [("dir", d) for d in outputDirs])
+        response = urlopen(Request("http://%s/output?%s" % (worker, query), None, {TOKEN_HEADER: self.token}))
+        try:
+            extractedFiles = extractOutput(response, localBuildDir, outputDirs)
+        except tarfile.TarError as e:
+            raise tarfile.TarError("%s in the output of '%s'" % (e, buildDir))
+        finally:
+            response.close()
+        printMessage("*** Fetched %d output file(s) of '%s' from worker '%s'." % (extractedFiles, buildDir, worker))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a build worker, which configures and builds what the SDK "
+                                                 "builders started with --workers send it. The requests are "
+                                                 "authenticated with a shared token, but not encrypted, so only "
+                                                 "bind it to trusted networks.")
+    parser.add_argument("-s", "--src-dir", required=True,
+                        help="The worker's copy of the sources of the SDK, in which the builds are done")
+    parser.add_argument("--bind", default="127.0.0.1", help="Address to listen on")
+    parser.add_argument("--port", type=int, default=DEFAULT_WORKER_PORT, help="Port to listen on")
+    parser.add_argument("--log-dir", default=os.path.join(os.getcwd(), "worker-logs"),
+                        help="Where to write the compressed output logs of the builds")
+    tokenGroup = parser.add_mutually_exclusive_group(required=True)
+    tokenGroup.add_argument("--token-file",
+                            help="File holding the token the builders must send, the same one they're given with "
+                                 "--worker-token-file")
+    tokenGroup.add_argument("--token", help="The token the builders must send. Prefer --token-file, the command "
+                                            "lines of the processes are visible to the other users.")
+    args = parser.parse_args()
+
+    try:
+        token = args.token or readToken(args.token_file)
+    except (IOError, OSError, ValueError) as e:
+        print("*** Can't read the token:", e)
+        exit(1)
+    server = BuildWorker((args.bind, args.port), os.path.abspath(args.src_dir), os.path.abspath(args.log_dir),
+                         token)
+    print("*** Build worker for '%s' listening on %s:%d ..." % (server.srcDir, args.bind, args.port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -23,12 +23,31 @@ import multiprocessing
 from abc import ABCMeta
 import abc
 import argparse
+import collections
 import json
 import os
-import subprocess
+import threading
 import time
 from distutils import spawn
+from artifact_store import ArtifactStore
+import build_output
+import build_journal
+import build_plan
 import build_utils
+import compiler_cache
+import debug_symbols
+import remote_build
+import sdk_packager
+import toolchains
+from build_history import BuildHistory, DEFAULT_HISTORY_SETTINGS
+from build_output import printMessage
+from build_journal import StepJournal
+from build_trace import tracer
+from path_filter import PathFilter
+import build_history
+from build_scheduler import BuildScheduler, PostBuildPipeline, getJobsPerBuild
+
+BUILD_CONFIGS = ["Debug", "Release", "RelWithDebInfo", "MinSizeRel"]
 
 #TODO: rename compiler to toolchain?
 #TODO: samples
@@ -41,132 +60,590 @@ class CMakeArgs:
 
 
 class BuildDetails:
-    def __init__(self, compiler, buildDir, cmakeArgs, buildCommands):
+    def __init__(self, compiler, buildDir, cmakeArgs, buildCommands, dependencies=None):
         self.compiler = compiler
         self.buildDir = buildDir
         self.cmakeArgs = cmakeArgs
         self.buildCommands = buildCommands
+        # the builds which must succeed before this one can start
+        self.dependencies = dependencies or []
 
 
 class SDKBuilder:
     __metaclass__ = ABCMeta
-    _toolchainToCMakeGeneratorMappings = {
-        "msvc2008": "Visual Studio 9 2008",
-        "msvc2010": "Visual Studio 10 2010",
-        "msvc2012": "Visual Studio 11 2012",
-        "msvc2013": "Visual Studio 12 2013",
-        "msvc2015": "Visual Studio 14 2015",
-        "mingw": "MinGW Makefiles"
-    }
 
     def __init__(self, args, sdkName):
-        print("*** Using args: ")
-        for key, value in vars(args).iteritems():
-            print('     ', key, '=', value)
+        printMessage("*** Using args: ")
+        for key, value in vars(args).items():
+            printMessage('     ', key, '=', value)
 
-        print("*** Builder for", sdkName, "| Current time: ", time.strftime("%c"),
-              "| Available cores: " + str(multiprocessing.cpu_count()))
+        printMessage("*** Builder for", sdkName, "| Current time: ", time.strftime("%c"),
+                     "| Available cores: " + str(multiprocessing.cpu_count()))
 
         self.sdkName = sdkName
         self.args = args
-        self.srcDir = args.src_dir
-        self.artifactsPath = args.artifacts_dir
-        self.artifactsUnarchivedPath = args.artifacts_unarchived_dir
-        self.toolchain = args.toolchain
-
-        self.ensureCanBuildSDK()
-
-        self.builds = self.createSDKBuilds()
+        self.srcDir = os.path.abspath(args.src_dir)
+        self.artifactsPath = os.path.abspath(args.artifacts_dir)
+        self.artifactsUnarchivedPath = os.path.abspath(args.artifacts_unarchived_dir)
+        self.logDir = os.path.abspath(args.log_dir or os.path.join(self.artifactsPath, "logs"))
+        self.toolchains = args.toolchain
+        self.cacheDir = os.path.abspath(args.cache_dir)
+        # planning only looks at the tree, it doesn't create or write anything
+        self.artifactStore = None
+        if not args.no_artifact_store and not args.plan:
+            try:
+                self.artifactStore = ArtifactStore(os.path.join(self.cacheDir, "store"),
+                                                   compiler_cache.parseSize(args.artifact_store_size))
+            except ValueError as e:
+                printMessage("***", e)
+                exit(1)
+        self.symbolStore = None
+        if args.debug_symbols == "store" and not args.plan:
+            self.symbolStore = debug_symbols.SymbolStore(
+                os.path.abspath(args.symbol_store_dir or os.path.join(self.artifactsPath, "symbols")),
+                self.artifactStore)
+        self.journal = StepJournal(os.path.join(self.cacheDir, "journal", self.sdkName + ".json"))
+        self.sourceTreeHashes = {}
+        self.hashLock = threading.Lock()
         self.config = self.loadConfig()
+        try:
+            self.compilerCache = compiler_cache.createCompilerCache(self.getCompilerCacheSettings(),
+                                                                    os.path.join(self.cacheDir, "compiler-cache"))
+        except ValueError as e:
+            printMessage("***", e)
+            exit(1)
+        # the cache is set up in our environment, the workers would run it unconfigured
+        if self.compilerCache is not None and args.workers:
+            printMessage("*** A compiler cache can't be used with build workers! Set it up on the workers instead.")
+            exit(1)
+
+        # the toolchains are only needed where the builds run, and planning doesn't run anything
+        self.remoteBuilder = None
+        if args.workers and not args.plan:
+            if not args.worker_token_file:
+                printMessage("*** The build workers need the token given with --worker-token-file!")
+                exit(1)
+            try:
+                self.remoteBuilder = remote_build.RemoteBuilder(args.workers,
+                                                                remote_build.readToken(args.worker_token_file))
+            except (IOError, OSError, ValueError) as e:
+                printMessage("***", e)
+                exit(1)
+        elif not args.plan:
+            self.ensureCanBuildSDK()
 
-        build_utils.setupPath(self.artifactsPath, False)
-        build_utils.setupPath(self.artifactsUnarchivedPath, False)
+        # the job budget of each build depends on how many builds we run at the same time,
+        # so we need to know the builds before we can generate their final commands
+        self.parallelBuilds = 1
+        self.builds = self.createSDKBuilds()
+        self.parallelBuilds = self.getParallelBuilds(self.builds)
+        if self.parallelBuilds > 1:
+            self.builds = self.createSDKBuilds()
+        self.history = BuildHistory(self.args.history_file or
+                                    os.path.join(os.path.dirname(os.path.abspath(args.config_file)),
+                                                 "build-history.jsonl"))
+        self.producedArtifacts = {}
+
+        if not args.plan:
+            build_utils.setupPath(self.artifactsPath, False)
+            build_utils.setupPath(self.artifactsUnarchivedPath, False)
 
     @staticmethod
     def hasExe(name):
         return spawn.find_executable(name) is not None
 
+    @staticmethod
+    def getToolchainExes(toolchain):
+        return toolchains.getToolchain(toolchain).getRequiredExes()
+
+    def getRequiredExes(self):
+        exes = []
+        for toolchain in self.toolchains:
+            exes.extend(exe for exe in self.getToolchainExes(toolchain) if exe not in exes)
+        if self.compilerCache is not None:
+            exes.append(self.compilerCache.executable)
+        return exes
+
     def ensureCanBuildSDK(self):
-        def ensureHasExe(name):
+        for name in self.getRequiredExes():
             if not self.hasExe(name):
-                print("No program named '%s' could be found on PATH! Aborting... " % name)
+                printMessage("No program named '%s' could be found on PATH! Aborting... " % name)
                 exit(1)
 
-        ensureHasExe('cmake')
-        if self.toolchain == "mingw":
-            ensureHasExe('mingw32-make')
-        else:
-            ensureHasExe('msbuild')
+    # the configs to build, from the command line or the config file, and otherwise the SDK's default ones
+    def getConfigs(self, defaultConfigs):
+        configs = self.args.configs or self.config.get("configs") or defaultConfigs
+        unknownConfigs = [config for config in configs if config not in BUILD_CONFIGS]
+        if unknownConfigs:
+            printMessage("*** Unknown build config(s) %s, expected some of: %s" %
+                         (", ".join(unknownConfigs), ", ".join(BUILD_CONFIGS)))
+            exit(1)
+        return configs
+
+    # the CMake targets to build, None for all of them
+    def getTargets(self):
+        return self.args.targets or self.config.get("targets") or None
+
+    def getParallelBuilds(self, builds):
+        if self.args.parallel_builds is not None:
+            return max(1, self.args.parallel_builds)
+        if self.args.workers:
+            return len(self.args.workers)
+
+        independentBuilds = max(sum(len(compilerBuilds) for compilerBuilds in builds.values()), 1)
+        return min(independentBuilds, multiprocessing.cpu_count())
+
+    def getJobsPerBuild(self):
+        if self.remoteBuilder is not None:
+            return self.remoteBuilder.getJobsPerBuild()
+        return getJobsPerBuild(self.parallelBuilds)
 
     def build(self):
+        if self.args.plan:
+            build_plan.writeBuildPlan(self, self.args.plan)
+            return
+
         old_path = os.getcwd()
         os.chdir(self.srcDir)
 
         depsStartTime = time.time()
-        print("*** Building ...")
+        printMessage("*** Building using at most %d parallel build(s) with %d job(s) each ..." %
+                     (self.parallelBuilds, self.getJobsPerBuild()))
 
-        for compiler, builds in self.builds.iteritems():
-            compilerStartTime = time.time()
-            print("\n*** Using '%s' compiler... | Current time: %s " % (compiler, time.strftime("%c")))
+        if self.compilerCache is not None:
+            self.compilerCache.setup()
 
-            for build in builds:
-                buildDir = os.path.join(self.srcDir, build.buildDir)
-                build_utils.setupPath(buildDir, not self.args.quick_mode)
-                os.chdir(buildDir)
+        with tracer.span("sdk:" + self.sdkName, "sdk"):
+            failedBuilds = self.buildAll()
 
-                if build_utils.invokeCMake(self.srcDir, build.cmakeArgs.generator, build.cmakeArgs.extraArgs) != 0:
-                    print("*** Error configuring CMake for", compiler)
-                    exit(1)
+        if self.compilerCache is not None:
+            self.compilerCache.printStats()
 
-                for command in build.buildCommands:
-                    print("*** Executing compiler command:", command)
-                    returnCode = subprocess.Popen(command).wait()
-                    if returnCode != 0:
-                        print("*** Compilation failed!")
-                        exit(1)
+        self.getHistorySettings()
+        self.saveConfig()
+        if self.artifactStore is not None:
+            self.artifactStore.save()
+        printMessage("***", self.sdkName, "total build time:", self.minsUntilNow(depsStartTime),
+                     "minutes. | Current time: ", time.strftime("%c"))
+        os.chdir(old_path)
 
-                print("*** Compilation using '%s' took %f minutes." % (compiler, self.minsUntilNow(compilerStartTime)))
+        tracer.printSummary()
+        self.recordHistory(failedBuilds)
+        traceFile = os.path.join(self.artifactsPath, self.sdkName + "-trace.json") \
+            if self.args.trace_file is None else self.args.trace_file
+        if traceFile:
+            tracer.writeChromeTrace(traceFile)
+
+        if failedBuilds:
+            for build, returnCode in failedBuilds:
+                printMessage("*** Build '%s' failed with return code %d." % (build.buildDir, returnCode))
+            exit(1)
+
+    # the command line overrides the 'compilerCache' entry of the config file, without being saved into it
+    def getCompilerCacheSettings(self):
+        settings = self.config.setdefault("compilerCache", {})
+        for key, value in compiler_cache.DEFAULT_COMPILER_CACHE_SETTINGS.items():
+            settings.setdefault(key, value)
+
+        settings = dict(settings)
+        for key, value in [("type", self.args.compiler_cache), ("executable", self.args.compiler_cache_exe),
+                           ("dir", self.args.compiler_cache_dir), ("maxSize", self.args.compiler_cache_size)]:
+            if value is not None:
+                settings[key] = value
+        return settings
+
+    def getHistorySettings(self):
+        settings = self.config.setdefault("history", {})
+        for key, value in DEFAULT_HISTORY_SETTINGS.items():
+            settings.setdefault(key, value)
+        return settings
+
+    # each toolchain gets its own record, so it's compared with its previous runs whatever it was built with
+    def recordHistory(self, failedBuilds):
+        for toolchain in self.toolchains:
+            # nothing was done for the toolchains whose artifacts were up to date
+            if toolchain not in self.producedArtifacts and \
+                    not [span for span in tracer.spans if span.toolchain == toolchain]:
+                continue
+
+            succeeded = not [build for build, _ in failedBuilds if build.compiler == toolchain]
+            previousRecords = self.history.load(self.sdkName, toolchain)
+            record = build_history.createRunRecord(self.sdkName, toolchain, tracer,
+                                                   self.producedArtifacts.get(toolchain, {}),
+                                                   build_history.RUN_SUCCEEDED if succeeded else
+                                                   build_history.RUN_FAILED)
+            self.history.append(record)
+
+            if self.args.compare:
+                build_history.printComparisonReport(record, previousRecords, self.getHistorySettings())
+
+    def buildAll(self):
+        self.cmakeInputsHash = None if self.args.no_configure_cache else build_utils.hashCMakeInputs(self.srcDir)
+
+        builds = collections.OrderedDict()
+        for compiler, compilerBuilds in self.builds.items():
+            if not self.args.force_build and self.isToolchainUpToDate(compiler):
+                printMessage("*** The artifacts of '%s' were already produced from the same inputs, skipping its "
+                             "builds." % compiler)
+                continue
+            builds[compiler] = compilerBuilds
+        if not builds:
+            return []
+
+        # the builds of all the toolchains share the same budget
+        allBuilds = [build for compilerBuilds in builds.values() for build in compilerBuilds]
+        pendingBuilds = dict((compiler, len(compilerBuilds)) for compiler, compilerBuilds in builds.items())
+        failedBuilds = []
+
+        pipeline = PostBuildPipeline()
+        pipeline.submit(self.runTracedStep, "gather:shared", "gather", self.gatherSharedArtifacts)
+
+        # a compiler's artifacts are gathered as soon as all its builds are done, while the others still build
+        def onBuildFinished(build, returnCode):
+            if returnCode != 0:
+                failedBuilds.append((build, returnCode))
+
+            compiler = build.compiler
+            pendingBuilds[compiler] -= 1
+            if pendingBuilds[compiler] > 0:
+                return
+
+            if [failedBuild for failedBuild, _ in failedBuilds if failedBuild.compiler == compiler]:
+                printMessage("*** Skipping artifacts gathering for '%s' compiler since some of its builds failed." %
+                             compiler)
+                return
+
+            pipeline.submit(self.runPostBuildSteps, compiler, self.builds[compiler])
+
+        def runBuild(build):
+            with tracer.toolchain(build.compiler):
+                return self.runBuild(build)
+
+        printMessage("\n*** Building for '%s' toolchain(s)... | Current time: %s " %
+                     ("', '".join(builds.keys()), time.strftime("%c")))
+        try:
+            BuildScheduler(self.parallelBuilds).run(allBuilds, runBuild, onBuildFinished)
+        finally:
+            pipeline.join()
 
-            self.onAfterBuild(compiler, builds)
-            self.gatherArtifacts(compiler, builds)
+        return failedBuilds
 
-        self.saveConfig()
-        print("***", self.sdkName, "total build time:", self.minsUntilNow(depsStartTime),
-              "minutes. | Current time: ", time.strftime("%c"))
-        os.chdir(old_path)
+    @staticmethod
+    def runTracedStep(name, category, step, *args):
+        with tracer.span(name, category):
+            step(*args)
+
+    def getPostBuildFingerprint(self, compiler, builds):
+        return build_journal.computeStepFingerprint(
+            [fingerprint for build in builds for fingerprint in self.getBuildStepFingerprints(build)],
+            self.getExternalInputsHash(compiler))
+
+    def runPostBuildSteps(self, compiler, builds):
+        fingerprint = self.getPostBuildFingerprint(compiler, builds)
+        archivesExist = not [name for name in self.getArchiveNames(compiler)
+                             if not os.path.isfile(os.path.join(self.artifactsPath, name))]
+        with tracer.toolchain(compiler):
+            for stepId, category, step in [("document:" + compiler, "document", self.onAfterBuild),
+                                           ("gather:" + compiler, "gather", self.gatherArtifacts)]:
+                # gathering also packages the artifacts, so it's only skipped when the archives are still there
+                if (category == "gather" and not archivesExist) or not self.isStepComplete(stepId, fingerprint):
+                    self.runJournaledStep(stepId, fingerprint, self.runTracedStep, stepId, category, step, compiler,
+                                          builds)
+
+        # the archives packaged by a previous run
+        if compiler not in self.producedArtifacts:
+            for name in self.getArchiveNames(compiler):
+                zipName = os.path.join(self.artifactsPath, name)
+                self.recordArtifact(compiler, zipName)
+
+    # the fast hash (of the file sizes and modification times) is enough to notice changes on the same machine
+    def getSourceTreeHash(self, contentHash=True):
+        with self.hashLock:
+            if contentHash not in self.sourceTreeHashes:
+                # the builder's own outputs may live inside the source dir too
+                self.sourceTreeHashes[contentHash] = build_utils.hashSourceTree(
+                    self.srcDir, excludeDirs=[self.artifactsPath, self.artifactsUnarchivedPath, self.cacheDir,
+                                              self.logDir],
+                    contentHash=contentHash)
+            return self.sourceTreeHashes[contentHash]
+
+    # with --resume, the steps which already completed with the same inputs are skipped
+    def isStepComplete(self, stepId, fingerprint):
+        if self.args.resume and self.journal.isComplete(stepId, fingerprint):
+            printMessage("*** Step '%s' already completed with the same inputs, skipping it." % stepId)
+            return True
+        return False
+
+    # records the outcome of the step in the journal, treating a zero (or no) return value as success
+    def runJournaledStep(self, stepId, fingerprint, step, *args):
+        self.journal.begin(stepId, fingerprint)
+        succeeded = False
+        try:
+            returnCode = step(*args)
+            succeeded = not returnCode
+            return returnCode
+        finally:
+            self.journal.end(stepId, fingerprint, succeeded)
+
+    def getConfigureStepFingerprint(self, build):
+        return build_journal.computeStepFingerprint(self.getSourceTreeHash(False), build.cmakeArgs.generator,
+                                                    build.cmakeArgs.extraArgs, self.getToolchainDetails(build.compiler))
+
+    # The job count of the commands is left out, it depends on how many builds run at the same time. The builds
+    # this one depends on and what the toolchain's builds use from outside the source tree are in instead.
+    def getBuildStepFingerprints(self, build):
+        configureFingerprint = self.getConfigureStepFingerprint(build)
+        dependencyFingerprints = [fingerprint for dependency in build.dependencies
+                                  for fingerprint in self.getBuildStepFingerprints(dependency)]
+        return [build_journal.computeStepFingerprint(configureFingerprint,
+                                                     build_utils.getJobIndependentCommand(command),
+                                                     dependencyFingerprints, self.getExternalInputsHash(build.compiler))
+                for command in build.buildCommands]
+
+    # the hash of what the builds of the toolchain use from outside the source tree (like a dependency SDK)
+    def getExternalInputsHash(self, toolchain):
+        return None
+
+    def getToolchainDetails(self, toolchain):
+        details = [toolchain]
+        for exe in self.getToolchainExes(toolchain):
+            details.append(spawn.find_executable(exe) or exe)
+        return details
+
+    def configureBuild(self, build):
+        buildDir = os.path.join(self.srcDir, build.buildDir)
+
+        fingerprint = None
+        if self.cmakeInputsHash is not None:
+            fingerprint = build_utils.computeConfigureFingerprint(
+                self.cmakeInputsHash, build.cmakeArgs.generator, build.cmakeArgs.extraArgs,
+                self.getToolchainDetails(build.compiler))
+            if build_utils.isConfigureUpToDate(buildDir, fingerprint):
+                printMessage("*** CMake configuration of '%s' is up to date, reusing the existing build tree." %
+                             build.buildDir)
+                return 0
+
+        build_utils.setupPath(buildDir, not self.args.quick_mode)
+        build_utils.clearConfigureFingerprint(buildDir)
+
+        hostArgs = toolchains.getToolchain(build.compiler).getHostConfigureArgs(self.parallelBuilds)
+        returnCode = build_utils.invokeCMake(self.srcDir, build.cmakeArgs.generator,
+                                             build.cmakeArgs.extraArgs + hostArgs, buildDir,
+                                             build_output.getLogBasePath(self.logDir, build.buildDir, "configure"),
+                                             self.args.echo_build_output)
+        if returnCode == 0 and fingerprint is not None:
+            build_utils.saveConfigureFingerprint(buildDir, fingerprint)
+        return returnCode
+
+    def runBuild(self, build):
+        if self.remoteBuilder is not None:
+            return self.runRemoteBuild(build)
+
+        buildStartTime = time.time()
+        buildDir = os.path.join(self.srcDir, build.buildDir)
+
+        # the build commands can only be skipped when the existing build tree is kept
+        canResume = not self.args.no_configure_cache and os.path.isfile(os.path.join(buildDir, "CMakeCache.txt"))
+
+        # configuring is never skipped, the configure cache already avoids configuring again when nothing changed
+        returnCode = self.runJournaledStep("configure:" + build.buildDir, self.getConfigureStepFingerprint(build),
+                                           self.configureBuild, build)
+        if returnCode != 0:
+            printMessage("*** Error configuring CMake for", build.buildDir)
+            return returnCode
+
+        for index, (command, fingerprint) in enumerate(zip(build.buildCommands, self.getBuildStepFingerprints(build))):
+            stepId = "build:%s:%d" % (build.buildDir, index)
+            if canResume and self.isStepComplete(stepId, fingerprint):
+                continue
+
+            returnCode = self.runJournaledStep(stepId, fingerprint, self.runBuildCommand, build, index, command)
+            if returnCode != 0:
+                printMessage("*** Compilation of '%s' failed!" % build.buildDir)
+                return returnCode
+
+        printMessage("*** Build '%s' took %f minutes." % (build.buildDir, self.minsUntilNow(buildStartTime)))
+        return 0
+
+    # the configure and build steps run on a worker, which sends back the outputs the artifacts are gathered from
+    def runRemoteBuild(self, build):
+        buildStartTime = time.time()
+        with tracer.span("remote:" + build.buildDir, "build"):
+            returnCode = self.remoteBuilder.runBuild(build, os.path.join(self.srcDir, build.buildDir),
+                                                     self.getRemoteOutputDirs(build),
+                                                     self.getRemoteDoxygenDirs(build),
+                                                     self.getToolchainDetails(build.compiler))
+        if returnCode == 0:
+            printMessage("*** Remote build '%s' took %f minutes." % (build.buildDir, self.minsUntilNow(buildStartTime)))
+        return returnCode
+
+    # the dirs of a build tree, relative to it, which gatherArtifacts needs
+    def getRemoteOutputDirs(self, build):
+        return ["bin", "lib", "include"]
+
+    # the dirs of a build tree in which the worker generates the documentation after the build
+    def getRemoteDoxygenDirs(self, build):
+        return []
+
+    def runBuildCommand(self, build, index, command):
+        printMessage("*** Executing compiler command:", command)
+        stepName = "build:%s:%d" % (build.buildDir, index)
+        with tracer.span(stepName, "build", command=" ".join(command)) as span:
+            returnCode, summary = build_output.runLoggedCommand(
+                stepName, command, os.path.join(self.srcDir, build.buildDir),
+                build_output.getLogBasePath(self.logDir, build.buildDir, "build-%d" % index),
+                self.args.echo_build_output)
+            span.args.update(summary.toDict())
+        return returnCode
 
     @staticmethod
     def minsUntilNow(startTime):
         return (time.time() - startTime) / 60.0
 
-    @abc.abstractmethod
     def createSDKBuilds(self):
+        builds = collections.OrderedDict()
+        for toolchain in self.toolchains:
+            builds[toolchain] = self.createToolchainBuilds(toolchain)
+            for build in builds[toolchain]:
+                self.applyCompilerCache(build)
+        return builds
+
+    def applyCompilerCache(self, build):
+        if self.compilerCache is None:
+            return
+
+        generator = build.cmakeArgs.generator
+        if not self.compilerCache.isSupported(generator):
+            printMessage("*** The '%s' compiler cache can't be used with the '%s' generator, building '%s' without "
+                         "it." % (self.compilerCache.name, generator, build.buildDir))
+            return
+
+        build.cmakeArgs.extraArgs = build.cmakeArgs.extraArgs + self.compilerCache.getCMakeArgs(generator)
+        msbuildArgs = self.compilerCache.getMSBuildArgs()
+        build.buildCommands = [command + msbuildArgs if command[0] == "msbuild" else command
+                               for command in build.buildCommands]
+
+    # the builds of the given configs of the CMake project 'projectName', as the toolchain's backend wants them:
+    # one build per config for single-config generators, one build for all the configs otherwise
+    def createConfigBuilds(self, buildClass, toolchain, buildDirSuffix, extraCMakeArgs, configs, projectName,
+                           *extraArgs):
+        backend = toolchains.getToolchain(toolchain)
+        if backend.multiConfig:
+            return [buildClass(toolchain, "build-" + toolchain + buildDirSuffix,
+                               CMakeArgs(backend.generator,
+                                         backend.getConfigureArgs(None) + extraCMakeArgs),
+                               [backend.getBuildCommand(projectName, config, self.getJobsPerBuild(), self.getTargets())
+                                for config in configs], *extraArgs)]
+
+        return [buildClass(toolchain, "build-%s-%s%s" % (toolchain, config, buildDirSuffix),
+                           CMakeArgs(backend.generator,
+                                     backend.getConfigureArgs(config) + extraCMakeArgs),
+                           [backend.getBuildCommand(projectName, config, self.getJobsPerBuild(), self.getTargets())],
+                           *extraArgs)
+                for config in configs]
+
+    @abc.abstractmethod
+    def createToolchainBuilds(self, toolchain):
         raise NotImplementedError
 
     @abc.abstractmethod
     def gatherArtifacts(self, compiler, builds):
         raise NotImplementedError
 
+    # allows skipping all the builds of a toolchain, when its artifacts from a previous run can be reused.
+    # The artifacts are only restored (if needed) when asked to.
+    def isToolchainUpToDate(self, toolchain, restore=True):
+        return False
+
+    # allows skipping a single build, whose outputs were cached by a previous run
+    def isBuildCached(self, build):
+        return False
+
+    # the names of the archives produced when gathering the artifacts of a compiler
+    def getArchiveNames(self, compiler):
+        return []
+
+    # the toolchain independent artifacts are gathered only once, before the artifacts of each compiler
+    def gatherSharedArtifacts(self):
+        pass
+
     def onAfterBuild(self, compiler, builds):
         pass
 
+    def getCompressionRules(self):
+        rules = self.config.get("compressionRules")
+        if rules is None:
+            return sdk_packager.DEFAULT_COMPRESSION_RULES
+
+        return [(pattern, sdk_packager.COMPRESSION_METHODS[method], level) for pattern, method, level in rules]
+
+    # the patterns of the files which can't go in the SDK archives, along with the debug symbols unless they're bundled
+    def getArchiveExcludes(self, *patterns):
+        if self.args.debug_symbols == "bundled":
+            return list(patterns)
+        return list(patterns) + debug_symbols.DEBUG_SYMBOL_PATTERNS
+
+    # the debug symbols taken out of the SDK archive 'zipName', which end up in their own archive or in the
+    # symbol store depending on --debug-symbols. None when they stay bundled.
+    def getSymbolsSpec(self, zipName, excludeFiles=None, pruneDirRegexes=None):
+        if self.args.debug_symbols == "bundled":
+            return None
+        return sdk_packager.ArchiveSpec(debug_symbols.getSymbolArchivePath(zipName),
+                                        pathFilter=PathFilter(includeFiles=debug_symbols.DEBUG_SYMBOL_PATTERNS,
+                                                              excludeFiles=excludeFiles,
+                                                              pruneDirRegexes=pruneDirRegexes))
+
+    # packages the artifacts gathered for the toolchain
+    def packageArtifacts(self, toolchain, sources, archives, symbols=None):
+        packager = sdk_packager.Packager(self.getCompressionRules(), self.args.compression_level,
+                                         incremental=not self.args.full_repackage)
+        if symbols is not None and self.args.debug_symbols == "archive":
+            archives = archives + [symbols]
+
+        # the archives only depend on the gathered files, the compression settings and where the symbols go
+        stepId = "zip:" + ",".join(os.path.basename(archive.zipName) for archive in archives)
+        fingerprint = build_journal.computeStepFingerprint(
+            [build_utils.hashSourceTree(os.path.join(self.artifactsUnarchivedPath, source), contentHash=False)
+             for source in sources],
+            packager.compressionRules, packager.defaultLevel, [archive.zipName for archive in archives],
+            self.args.debug_symbols)
+        allArchivesExist = not [archive for archive in archives if not os.path.isfile(archive.zipName)]
+        if not (allArchivesExist and self.isStepComplete(stepId, fingerprint)):
+            self.runJournaledStep(stepId, fingerprint, packager.makeZips, sources, archives,
+                                  self.artifactsUnarchivedPath)
+
+        for archive in archives:
+            self.recordArtifact(toolchain, archive.zipName)
+
+        if symbols is not None and self.symbolStore is not None:
+            symbolFiles = [(path, relPath) for path, relPath, _ in
+                           packager.collectFiles(sources, [symbols], self.artifactsUnarchivedPath)]
+            self.runTracedStep("symbols:" + ",".join(sources), "symbols", self.symbolStore.addFiles, symbolFiles,
+                               ",".join(sources))
+
+    # the archive's manifest has an entry per file, whether it was packaged by this run or a previous one
+    def recordArtifact(self, toolchain, zipName):
+        self.producedArtifacts.setdefault(toolchain, {})[os.path.basename(zipName)] = {
+            "size": os.path.getsize(zipName), "files": len(sdk_packager.ArchiveManifest.load(zipName).entries)}
+
     @classmethod
     def getAvailableToolchains(cls):
-        return cls._toolchainToCMakeGeneratorMappings.keys()
+        return sorted(toolchains.TOOLCHAINS.keys())
 
     @classmethod
     def getCMakeGenerator(cls, toolchain):
-        return cls._toolchainToCMakeGeneratorMappings[toolchain]
+        return toolchains.getToolchain(toolchain).generator
 
     @classmethod
     def getDefaultArgParse(cls, sdkName):
         currentPath = os.getcwd()
 
-        parser = argparse.ArgumentParser(description="Build " + sdkName + " for Windows.")
+        parser = argparse.ArgumentParser(description="Build the " + sdkName + " SDK.")
         parser.add_argument("-s", "--src-dir", required=True,
                             help="Path to the " + sdkName + " sources")
-        parser.add_argument("-t", "--toolchain", required=True,
-                            help="The toolchain to be used when generating the SDK",
+        parser.add_argument("-t", "--toolchain", required=True, nargs="+",
+                            help="The toolchain(s) to be used when generating the SDK. Multiple toolchains are built "
+                                 "in the same run, sharing the available cores and the toolchain independent work.",
                             choices=cls.getAvailableToolchains())
 
         parser.add_argument("--config-file", default=os.path.join(os.path.abspath(os.path.dirname(__file__)), "config.json"),
@@ -178,6 +655,101 @@ class SDKBuilder:
                             default=os.path.join(currentPath, "artifacts", "unarchived"),
                             help="Directory where to store the final unarchived artifacts")
 
+        parser.add_argument("--log-dir", default=None,
+                            help="Where to write the compressed output logs of the configure and build commands. "
+                                 "Defaults to <artifacts-dir>/logs.")
+        parser.add_argument("--echo-build-output", action="store_true",
+                            help="Also print the whole output of the configure and build commands, instead of only "
+                                 "a summary of each")
+
+        parser.add_argument("--cache-dir", default=os.path.join(currentPath, "sdk-cache"),
+                            help="Directory where the builder keeps data reused between runs")
+        parser.add_argument("--no-artifact-store", action="store_true",
+                            help="Copy the gathered artifacts instead of linking them from the content-addressed "
+                                 "store in the cache directory")
+        parser.add_argument("--artifact-store-size", default="20G",
+                            help="Size limit of the artifact store, e.g. '20G' (the default). The least recently "
+                                 "used files are evicted past it. The store (<cache-dir>/store) can also be deleted "
+                                 "between runs.")
+
+        parser.add_argument("--compression-level", type=int, default=sdk_packager.DEFAULT_COMPRESSION_LEVEL,
+                            choices=range(0, 10),
+                            help="Deflate level used for the files which don't match any of the 'compressionRules' "
+                                 "([pattern, 'stored'|'deflated', level] entries) of the config file")
+
+        parser.add_argument("--full-repackage", action="store_true",
+                            help="Compress every archive entry again instead of reusing the unchanged ones "
+                                 "from the previously built archives")
+
+        parser.add_argument("--debug-symbols", default="bundled", choices=debug_symbols.DEBUG_SYMBOL_MODES,
+                            help="Where the debug symbols (PDBs) go: in the SDK archives (bundled), in a separate "
+                                 "<archive>-symbols.zip next to each of them (archive) or in the symbol store, "
+                                 "indexed by file name and hash (store)")
+        parser.add_argument("--symbol-store-dir", default=None,
+                            help="Directory of the symbol store used by '--debug-symbols store'. Defaults to "
+                                 "<artifacts-dir>/symbols.")
+
+        parser.add_argument("-j", "--parallel-builds", type=int, default=None,
+                            help="How many independent builds to run at the same time. The available cores are split "
+                                 "between them. Defaults to the number of independent builds of a compiler.")
+
+        parser.add_argument("--workers", nargs="+", default=None, metavar="HOST:PORT",
+                            help="Run the configure and build steps on these build workers (started with "
+                                 "remote_build.py) instead of locally, one build at a time per listed worker. "
+                                 "The artifacts are still gathered and packaged here.")
+        parser.add_argument("--worker-token-file", default=None,
+                            help="File holding the token shared with the build workers (see the --token-file "
+                                 "option of remote_build.py). Required with --workers.")
+
+        parser.add_argument("--configs", nargs="+", default=None, choices=BUILD_CONFIGS,
+                            help="The configs to build. Overrides the 'configs' entry of the config file, and "
+                                 "defaults to Debug and RelWithDebInfo.")
+        parser.add_argument("--targets", nargs="+", default=None,
+                            help="Only build these CMake targets (e.g. CEGUIBase-0) instead of everything, for a "
+                                 "partial SDK. Overrides the 'targets' entry of the config file.")
+
+        parser.add_argument("--compiler-cache", default=None,
+                            choices=["none"] + sorted(compiler_cache.COMPILER_CACHES.keys()),
+                            help="Compiler cache wrapping every compilation. Overrides the 'type' of the "
+                                 "'compilerCache' entry of the config file, which defaults to none. Not "
+                                 "available with --workers.")
+        parser.add_argument("--compiler-cache-exe", default=None,
+                            help="Path to the compiler cache executable, if it's not on PATH under its usual name")
+        parser.add_argument("--compiler-cache-dir", default=None,
+                            help="Where the compiler cache keeps its objects. Defaults to "
+                                 "<cache-dir>/compiler-cache/<type>.")
+        parser.add_argument("--compiler-cache-size", default=None,
+                            help="Size limit of the compiler cache, e.g. '10G' (the default)")
+
+        parser.add_argument("--no-configure-cache", action="store_true",
+                            help="Always wipe the build directories and configure them again, even if the CMake "
+                                 "inputs didn't change since the last configuration.")
+
+        parser.add_argument("--force-build", action="store_true",
+                            help="Build every toolchain, even the ones whose artifacts were already produced from "
+                                 "the same inputs by a previous run")
+
+        parser.add_argument("--resume", action="store_true",
+                            help="Skip the steps (build commands, documentation, gathering and packaging) which "
+                                 "already completed with the same inputs in a previous run, as recorded in the step "
+                                 "journal kept in the cache dir")
+
+        parser.add_argument("--trace-file", default=None,
+                            help="Where to write the Chrome trace (also loadable in Perfetto) of the build phases. "
+                                 "Defaults to <artifacts-dir>/<sdk>-trace.json, pass an empty value to disable it.")
+
+        parser.add_argument("--history-file", default=None,
+                            help="Append-only file where the timings and artifact sizes of every run are recorded. "
+                                 "Defaults to build-history.jsonl next to the config file.")
+        parser.add_argument("--compare", action="store_true",
+                            help="Report the phases which got slower and the artifacts which grew compared to the "
+                                 "previous runs, using the thresholds from the 'history' entry of the config file")
+
+        parser.add_argument("--plan", default=None, metavar="PLAN_FILE",
+                            help="Don't build anything, only write the steps which would be run (with their "
+                                 "dependencies, cache hit predictions and time estimates from the build history) "
+                                 "as JSON to this file. The toolchains don't need to be installed.")
+
         parser.add_argument("--quick-mode", action="store_true", help=argparse.SUPPRESS)
         return parser
 
@@ -190,7 +762,9 @@ class SDKBuilder:
             with open(self.args.config_file, 'r') as f:
                 return json.load(f)
         except:
-            print("*** No config file found at", self.args.config_file, ". Creating a default one...")
+            if self.args.plan:
+                return {}
+            printMessage("*** No config file found at", self.args.config_file, ". Creating a default one...")
             with open(self.args.config_file, 'w') as f:
                 json.dump({}, f)
             return {}
@@ -0,0 +1,131 @@
+##############################################################################
+#   CEGUI SDK Builder archive manifests
+#
+#   Copyright (C) 2014-2016   Timotei Dolean <timotei21@gmail.com>
+#                             and contributing authors (see AUTHORS file)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+##############################################################################
+from __future__ import print_function
+
+import argparse
+import multiprocessing
+import os
+import sys
+from multiprocessing.pool import ThreadPool
+import build_utils
+
+# The manifest written next to each archive lists the SHA-256 of every entry, in the format of sha256sum
+# ("<digest>  <path>" lines), so it can also be checked with 'sha256sum -c' from the extraction directory.
+# The digests are computed by the packager while it compresses the entries, so the files are read only once.
+
+
+def getManifestPath(zipName):
+    return zipName + ".sha256sums"
+
+
+# entries maps each archive path to its digest
+def writeManifest(zipName, entries):
+    path = getManifestPath(zipName)
+    with open(path + ".tmp", 'w') as f:
+        for arcname in sorted(entries.keys()):
+            f.write("%s  %s\n" % (entries[arcname], arcname))
+    if os.path.exists(path):
+        os.remove(path)
+    os.rename(path + ".tmp", path)
+
+
+def loadManifest(path):
+    entries = {}
+    with open(path, 'r') as f:
+        for lineNumber, line in enumerate(f, 1):
+            line = line.rstrip("\r\n")
+            if not line:
+                continue
+            digest, separator, arcname = line.partition("  ")
+            if not separator or len(digest) != 64:
+                raise ValueError("%s:%d: expected '<sha256>  <path>', got '%s'" % (path, lineNumber, line))
+            entries[arcname] = digest.lower()
+    return entries
+
+
+def hashEntry(rootDir, arcname):
+    try:
+        return build_utils.hashFile(os.path.join(rootDir, *arcname.split('/')))
+    except (IOError, OSError):
+        return None
+
+
+# Checks the files extracted in rootDir against the manifest entries, hashing them on a thread pool (hashlib
+# releases the GIL for big blocks, so the hashing runs on every core). Returns the (missing, mismatched, extra)
+# lists of archive paths; extra files are only looked for under the top level directories of the manifest.
+def verifyTree(entries, rootDir, workers=None):
+    arcnames = sorted(entries.keys())
+    pool = ThreadPool(workers or multiprocessing.cpu_count())
+    try:
+        digests = pool.map(lambda arcname: hashEntry(rootDir, arcname), arcnames, chunksize=16)
+    finally:
+        pool.close()
+        pool.join()
+
+    missing = [arcname for arcname, digest in zip(arcnames, digests) if digest is None]
+    mismatched = [arcname for arcname, digest in zip(arcnames, digests)
+                  if digest is not None and digest != entries[arcname]]
+
+    extra = []
+    for topLevelDir in sorted(set(arcname.split('/')[0] for arcname in arcnames if '/' in arcname)):
+        for root, dirs, files in os.walk(os.path.join(rootDir, topLevelDir)):
+            dirs.sort()
+            for name in sorted(files):
+                arcname = os.path.relpath(os.path.join(root, name), rootDir).replace(os.sep, '/')
+                if arcname not in entries:
+                    extra.append(arcname)
+
+    return missing, mismatched, extra
+
+
+def verify(args):
+    try:
+        entries = loadManifest(args.manifest)
+    except (IOError, OSError, ValueError) as e:
+        print("*** Can't read the manifest:", e)
+        return 2
+
+    print("*** Verifying %d file(s) of '%s' in '%s' ..." % (len(entries), args.manifest, args.dir))
+    missing, mismatched, extra = verifyTree(entries, args.dir, args.jobs)
+    for title, arcnames in [("Missing", missing), ("Changed", mismatched), ("Not in the manifest", extra)]:
+        for arcname in arcnames:
+            print("     %s: %s" % (title, arcname))
+
+    failed = missing or mismatched or (extra and args.strict)
+    print("*** %s: %d missing, %d changed and %d extra file(s)." %
+          ("FAILED" if failed else "OK", len(missing), len(mismatched), len(extra)))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Work with the SHA-256 manifests written next to the SDK archives.")
+    subparsers = parser.add_subparsers(dest="command")
+    verifyParser = subparsers.add_parser("verify", help="Check an extracted SDK against the manifest of its archive")
+    verifyParser.add_argument("manifest", help="The <archive>.sha256sums file")
+    verifyParser.add_argument("dir", help="Directory where the archive was extracted")
+    verifyParser.add_argument("-j", "--jobs", type=int, default=None,
+                              help="How many files to hash at the same time. Defaults to the number of cores.")
+    verifyParser.add_argument("--strict", action="store_true",
+                              help="Also fail when the SDK directories contain files which are not in the manifest")
+    args = parser.parse_args()
+
+    if args.command == "verify":
+        sys.exit(verify(args))
+    parser.print_help()
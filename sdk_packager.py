@@ -0,0 +1,426 @@
+##############################################################################
+#   CEGUI SDK Builder packager
+#
+#   Copyright (C) 2014-2016   Timotei Dolean <timotei21@gmail.com>
+#                             and contributing authors (see AUTHORS file)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+##############################################################################
+from __future__ import print_function
+
+import collections
+import fnmatch
+import hashlib
+import json
+import multiprocessing
+import os
+import struct
+import tempfile
+import time
+import zipfile
+import zlib
+from multiprocessing.pool import ThreadPool
+import sdk_manifest
+from build_output import printMessage
+from build_trace import tracer
+from path_filter import PathFilter
+
+DEFAULT_COMPRESSION_LEVEL = 6
+COMPRESSION_METHODS = {"stored": zipfile.ZIP_STORED, "deflated": zipfile.ZIP_DEFLATED}
+
+# these are already compressed, deflating them again only burns CPU
+DEFAULT_COMPRESSION_RULES = [(pattern, zipfile.ZIP_STORED, 0) for pattern in
+                             ["*.zip", "*.7z", "*.gz", "*.bz2", "*.xz", "*.png", "*.jpg", "*.jpeg", "*.ogg", "*.mp3"]]
+
+READ_BLOCK_SIZE = 1024 * 1024
+# compressed entries bigger than this are spooled to disk until they get written in the archive
+SPOOL_MAX_SIZE = 8 * 1024 * 1024
+
+ZIP64_LIMIT = 0xFFFFFFFF
+ZIP_MAX_ENTRIES = 0xFFFF
+ZIP64_MARKER = 0xFFFFFFFF
+ZIP64_ENTRIES_MARKER = 0xFFFF
+CREATE_SYSTEM = 0 if os.name == "nt" else 3
+
+
+class ArchiveSpec:
+    def __init__(self, zipName, patternsToIgnore=None, pathFilter=None):
+        self.zipName = zipName
+        self.entryCount = 0
+
+        # the ignore patterns are regexes matched both against the directories and the file names
+        if pathFilter is None:
+            pathFilter = PathFilter(excludeFileRegexes=patternsToIgnore, pruneDirRegexes=patternsToIgnore)
+        self.pathFilter = pathFilter
+
+
+class ArchiveEntry:
+    def __init__(self, arcname, path, method):
+        self.arcname = arcname
+        self.method = method
+
+        stat = os.stat(path)
+        self.size = stat.st_size
+        self.mtime = stat.st_mtime
+        self.externalAttr = (stat.st_mode & 0xFFFF) << 16
+        self.dosTime, self.dosDate = toDosDateTime(stat.st_mtime)
+
+        self.crc = 0
+        self.compressSize = 0
+        self.data = None
+        self.dataOffset = 0
+
+
+class CompressedEntry(ArchiveEntry):
+    def __init__(self, arcname, path, method, level):
+        ArchiveEntry.__init__(self, arcname, path, method)
+        self.level = level
+        self.sha256 = None
+        self.data = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+
+
+# an entry whose compressed bytes are copied as they are from a previously built archive
+class RawEntry(ArchiveEntry):
+    def __init__(self, arcname, path, previousArchive, zipInfo):
+        ArchiveEntry.__init__(self, arcname, path, zipInfo.compress_type)
+        self.size = zipInfo.file_size
+        self.crc = zipInfo.CRC
+        self.compressSize = zipInfo.compress_size
+        self.data = previousArchive
+
+        previousArchive.seek(zipInfo.header_offset)
+        localHeader = previousArchive.read(30)
+        nameLength, extraLength = struct.unpack("<HH", localHeader[26:30])
+        self.dataOffset = zipInfo.header_offset + 30 + nameLength + extraLength
+
+
+def toDosDateTime(timestamp):
+    year, month, day, hour, minute, second = time.localtime(timestamp)[0:6]
+    if year < 1980:
+        year, month, day, hour, minute, second = 1980, 1, 1, 0, 0, 0
+
+    return (hour << 11) | (minute << 5) | (second // 2), ((year - 1980) << 9) | (month << 5) | day
+
+
+def encodeArcname(arcname):
+    # Python 2 gives us already encoded paths
+    if isinstance(arcname, bytes):
+        try:
+            arcname.decode('ascii')
+            return arcname, 0
+        except UnicodeDecodeError:
+            return arcname, 0x800
+
+    try:
+        return arcname.encode('ascii'), 0
+    except UnicodeEncodeError:
+        return arcname.encode('utf-8'), 0x800
+
+
+# Like pool.imap, but with at most 'window' tasks submitted and not yet consumed, so the compressed
+# entries waiting for a slow entry ahead of them to be written can't pile up in memory
+def imapBounded(pool, function, items, window):
+    pending = collections.deque()
+    for item in items:
+        if len(pending) >= window:
+            yield pending.popleft().get()
+        pending.append(pool.apply_async(function, (item,)))
+    while pending:
+        yield pending.popleft().get()
+
+
+def compressFile(path, arcname, method, level):
+    entry = CompressedEntry(arcname, path, method, level)
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15) if method == zipfile.ZIP_DEFLATED else None
+    hasher = hashlib.sha256()
+
+    crc = 0
+    with open(path, 'rb') as f:
+        block = f.read(READ_BLOCK_SIZE)
+        while block:
+            crc = zlib.crc32(block, crc)
+            hasher.update(block)
+            entry.data.write(compressor.compress(block) if compressor is not None else block)
+            block = f.read(READ_BLOCK_SIZE)
+
+    if compressor is not None:
+        entry.data.write(compressor.flush())
+
+    entry.crc = crc & 0xFFFFFFFF
+    entry.sha256 = hasher.hexdigest()
+    entry.compressSize = entry.data.tell()
+    return entry
+
+
+def getManifestPath(zipName):
+    return zipName + ".manifest.json"
+
+
+# What went into an archive, so the next packaging run can tell which entries are still up to date
+class ArchiveManifest:
+    def __init__(self, entries=None):
+        # arcname -> [size, mtime, sha256, crc, method, level]
+        self.entries = entries or {}
+
+    @classmethod
+    def load(cls, zipName):
+        try:
+            with open(getManifestPath(zipName), 'r') as f:
+                return cls(json.load(f)["entries"])
+        except (IOError, OSError, ValueError, KeyError):
+            return cls()
+
+    def save(self, zipName):
+        with open(getManifestPath(zipName), 'w') as f:
+            json.dump({"entries": self.entries}, f, sort_keys=True)
+
+    def isUpToDate(self, arcname, stat, method, level, zipInfo):
+        entry = self.entries.get(arcname)
+        return entry is not None and zipInfo is not None and \
+            entry[0] == stat.st_size and entry[1] == stat.st_mtime and entry[4] == method and entry[5] == level and \
+            entry[3] == zipInfo.CRC and entry[0] == zipInfo.file_size
+
+
+class PreviousArchive:
+    def __init__(self, zipName):
+        self.manifest = ArchiveManifest()
+        self.fp = None
+        self.zipInfos = {}
+
+        if not os.path.isfile(zipName):
+            return
+
+        try:
+            with zipfile.ZipFile(zipName, 'r') as zipFile:
+                self.zipInfos = dict((zipInfo.filename, zipInfo) for zipInfo in zipFile.infolist())
+        except zipfile.BadZipfile:
+            return
+
+        self.manifest = ArchiveManifest.load(zipName)
+        self.fp = open(zipName, 'rb')
+
+    def isUpToDate(self, arcname, stat, method, level):
+        return self.fp is not None and \
+            self.manifest.isUpToDate(arcname, stat, method, level, self.zipInfos.get(arcname))
+
+    def close(self):
+        if self.fp is not None:
+            self.fp.close()
+
+
+# A minimal zip writer which takes already compressed entries, so the compression
+# can happen anywhere (and only once, even if the entry goes into multiple archives)
+class ZipWriter:
+    def __init__(self, path):
+        self.path = path
+        self.fp = open(path, 'wb')
+        self.centralDirectory = []
+
+    def addEntry(self, entry):
+        offset = self.fp.tell()
+        arcname, flags = encodeArcname(entry.arcname)
+
+        isZip64 = entry.size >= ZIP64_LIMIT or entry.compressSize >= ZIP64_LIMIT
+        if isZip64:
+            extra = struct.pack("<HHQQ", 0x0001, 16, entry.size, entry.compressSize)
+            sizes = (ZIP64_MARKER, ZIP64_MARKER)
+        else:
+            extra = b""
+            sizes = (entry.compressSize, entry.size)
+
+        self.fp.write(struct.pack("<IHHHHHIIIHH", 0x04034b50, 45 if isZip64 else 20, flags, entry.method,
+                                  entry.dosTime, entry.dosDate, entry.crc, sizes[0], sizes[1],
+                                  len(arcname), len(extra)))
+        self.fp.write(arcname)
+        self.fp.write(extra)
+
+        entry.data.seek(entry.dataOffset)
+        remaining = entry.compressSize
+        while remaining > 0:
+            block = entry.data.read(min(READ_BLOCK_SIZE, remaining))
+            if not block:
+                raise IOError("Unexpected end of data while writing '%s' to '%s'" % (entry.arcname, self.path))
+            self.fp.write(block)
+            remaining -= len(block)
+
+        self.centralDirectory.append((entry, arcname, flags, offset))
+
+    def writeCentralDirectoryEntry(self, entry, arcname, flags, offset):
+        zip64Fields = []
+        size, compressSize, headerOffset = entry.size, entry.compressSize, offset
+        if size >= ZIP64_LIMIT:
+            zip64Fields.append(size)
+            size = ZIP64_MARKER
+        if compressSize >= ZIP64_LIMIT:
+            zip64Fields.append(compressSize)
+            compressSize = ZIP64_MARKER
+        if headerOffset >= ZIP64_LIMIT:
+            zip64Fields.append(headerOffset)
+            headerOffset = ZIP64_MARKER
+
+        extra = b""
+        if zip64Fields:
+            extra = struct.pack("<HH" + "Q" * len(zip64Fields), 0x0001, 8 * len(zip64Fields), *zip64Fields)
+        version = 45 if zip64Fields else 20
+
+        self.fp.write(struct.pack("<IBBHHHHHIIIHHHHHII", 0x02014b50, version, CREATE_SYSTEM, version, flags,
+                                  entry.method, entry.dosTime, entry.dosDate, entry.crc, compressSize, size,
+                                  len(arcname), len(extra), 0, 0, 0, entry.externalAttr, headerOffset))
+        self.fp.write(arcname)
+        self.fp.write(extra)
+
+    def close(self):
+        centralDirectoryOffset = self.fp.tell()
+        for centralDirectoryEntry in self.centralDirectory:
+            self.writeCentralDirectoryEntry(*centralDirectoryEntry)
+        centralDirectorySize = self.fp.tell() - centralDirectoryOffset
+        entries = len(self.centralDirectory)
+
+        if entries > ZIP_MAX_ENTRIES or centralDirectoryOffset >= ZIP64_LIMIT or centralDirectorySize >= ZIP64_LIMIT:
+            zip64EndOffset = self.fp.tell()
+            self.fp.write(struct.pack("<IQHHIIQQQQ", 0x06064b50, 44, 45, 45, 0, 0, entries, entries,
+                                      centralDirectorySize, centralDirectoryOffset))
+            self.fp.write(struct.pack("<IIQI", 0x07064b50, 0, zip64EndOffset, 1))
+            entries = ZIP64_ENTRIES_MARKER
+            centralDirectorySize = ZIP64_MARKER
+            centralDirectoryOffset = ZIP64_MARKER
+
+        self.fp.write(struct.pack("<IHHHHIIH", 0x06054b50, 0, 0, entries, entries,
+                                  centralDirectorySize, centralDirectoryOffset, 0))
+        self.fp.close()
+
+
+class Packager:
+    def __init__(self, compressionRules=None, defaultLevel=DEFAULT_COMPRESSION_LEVEL, workers=None, incremental=True):
+        self.compressionRules = DEFAULT_COMPRESSION_RULES if compressionRules is None else compressionRules
+        self.defaultLevel = defaultLevel
+        self.workers = workers or multiprocessing.cpu_count()
+        self.incremental = incremental
+
+    def getCompression(self, name):
+        for pattern, method, level in self.compressionRules:
+            if fnmatch.fnmatch(name, pattern):
+                return method, level
+
+        return zipfile.ZIP_DEFLATED, self.defaultLevel
+
+    def collectFiles(self, sources, archives, baseDir):
+        files = []
+        for source in sources:
+            # the archives which still want the contents of each walked directory
+            dirArchives = {os.path.join(baseDir, source): archives}
+
+            for root, dirs, names in os.walk(os.path.join(baseDir, source)):
+                relRoot = os.path.relpath(root, baseDir)
+                rootArchives = dirArchives.pop(root)
+
+                keptDirs = []
+                for d in sorted(dirs):
+                    relPath = os.path.join(relRoot, d)
+                    subdirArchives = [archive for archive in rootArchives if not archive.pathFilter.isDirPruned(relPath)]
+                    if subdirArchives:
+                        dirArchives[os.path.join(root, d)] = subdirArchives
+                        keptDirs.append(d)
+                dirs[:] = keptDirs
+
+                for name in sorted(names):
+                    fileArchives = [archive for archive in rootArchives if not archive.pathFilter.isFileIgnored(name)]
+                    if fileArchives:
+                        files.append((os.path.join(root, name),
+                                      os.path.join(relRoot, name).replace(os.sep, '/'),
+                                      fileArchives))
+
+        return files
+
+    def makeZips(self, sources, archives, baseDir=None):
+        with tracer.span("zip:" + ",".join(os.path.basename(archive.zipName) for archive in archives), "zip") as span:
+            bytesRead = self.writeZips(sources, archives, baseDir)
+            span.addBytes(bytesRead, sum(os.path.getsize(archive.zipName) for archive in archives))
+
+    # Builds all the given archives from a single walk of the sources, reading and compressing every file only once.
+    # In incremental mode, entries which didn't change since the previous archive are copied from it as they are.
+    # Returns how many bytes were read from the sources.
+    def writeZips(self, sources, archives, baseDir=None):
+        baseDir = baseDir or os.getcwd()
+        for archive in archives:
+            printMessage("*** Creating zip archive in", archive.zipName, "with sources", sources, "...")
+
+        files = self.collectFiles(sources, archives, baseDir)
+        previousArchives = dict((archive.zipName, PreviousArchive(archive.zipName) if self.incremental else None)
+                                for archive in archives)
+
+        def compress(fileDetails):
+            path, arcname, fileArchives = fileDetails
+            method, level = self.getCompression(os.path.basename(path))
+            stat = os.stat(path)
+
+            previous = [previousArchives[archive.zipName] for archive in fileArchives]
+            if all(p is not None and p.isUpToDate(arcname, stat, method, level) for p in previous):
+                return None
+            return compressFile(path, arcname, method, level)
+
+        writers = dict((archive.zipName, ZipWriter(archive.zipName + ".tmp")) for archive in archives)
+        manifests = dict((archive.zipName, ArchiveManifest()) for archive in archives)
+        reusedEntries = 0
+        bytesRead = 0
+        pool = ThreadPool(self.workers)
+        succeeded = False
+        try:
+            # zlib releases the GIL while compressing, so threads are enough to use all the cores
+            entries = imapBounded(pool, compress, files, 2 * self.workers)
+            for entry, (path, arcname, fileArchives) in zip(entries, files):
+                for archive in fileArchives:
+                    if entry is None:
+                        previous = previousArchives[archive.zipName]
+                        writers[archive.zipName].addEntry(
+                            RawEntry(arcname, path, previous.fp, previous.zipInfos[arcname]))
+                        manifests[archive.zipName].entries[arcname] = previous.manifest.entries[arcname]
+                        reusedEntries += 1
+                    else:
+                        writers[archive.zipName].addEntry(entry)
+                        manifests[archive.zipName].entries[arcname] = [entry.size, entry.mtime, entry.sha256,
+                                                                       entry.crc, entry.method, entry.level]
+
+                if entry is not None:
+                    bytesRead += entry.size
+                    entry.data.close()
+            succeeded = True
+        finally:
+            pool.close()
+            pool.join()
+            for writer in writers.values():
+                writer.close()
+                if not succeeded:
+                    os.remove(writer.path)
+            for previous in previousArchives.values():
+                if previous is not None:
+                    previous.close()
+
+        for archive in archives:
+            for manifestPath in [getManifestPath(archive.zipName), sdk_manifest.getManifestPath(archive.zipName)]:
+                if os.path.exists(manifestPath):
+                    os.remove(manifestPath)
+            if os.path.exists(archive.zipName):
+                os.remove(archive.zipName)
+            os.rename(archive.zipName + ".tmp", archive.zipName)
+            manifests[archive.zipName].save(archive.zipName)
+            # the digests were computed while compressing, so the consumers' manifest costs no extra read
+            sdk_manifest.writeManifest(archive.zipName, dict((arcname, entry[2]) for arcname, entry in
+                                                             manifests[archive.zipName].entries.items()))
+            archive.entryCount = len(manifests[archive.zipName].entries)
+
+        if self.incremental:
+            printMessage("*** Reused %d unchanged zip entries from the previous archives." % reusedEntries)
+
+        return bytesRead
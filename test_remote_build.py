@@ -0,0 +1,82 @@
+##############################################################################
+#   CEGUI SDK Builder remote build worker tests
+#
+#   Copyright (C) 2014-2016   Timotei Dolean <timotei21@gmail.com>
+#                             and contributing authors (see AUTHORS file)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+##############################################################################
+import io
+import os
+import shutil
+import tarfile
+import tempfile
+import unittest
+import remote_build
+
+
+@unittest.skipUnless(hasattr(os, "symlink"), "needs symlinks")
+class OutputTransferTest(unittest.TestCase):
+    def setUp(self):
+        self.tempDir = tempfile.mkdtemp()
+        self.workerDir = os.path.join(self.tempDir, "worker")
+        self.localDir = os.path.join(self.tempDir, "local")
+        os.makedirs(os.path.join(self.workerDir, "lib"))
+        os.makedirs(self.localDir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempDir)
+
+    def transfer(self, dirs):
+        stream = io.BytesIO()
+        remote_build.writeOutput(stream, self.workerDir, dirs)
+        stream.seek(0)
+        return remote_build.extractOutput(stream, self.localDir, dirs)
+
+    def testRoundTripKeepsSymlinks(self):
+        with open(os.path.join(self.workerDir, "lib", "libfoo.so.1"), 'w') as f:
+            f.write("library")
+        # the SONAME links of a shared library
+        os.symlink("libfoo.so.1", os.path.join(self.workerDir, "lib", "libfoo.so"))
+
+        self.assertEqual(self.transfer(["lib"]), 2)
+        link = os.path.join(self.localDir, "lib", "libfoo.so")
+        self.assertTrue(os.path.islink(link))
+        self.assertEqual(os.readlink(link), "libfoo.so.1")
+        with open(link, 'r') as f:
+            self.assertEqual(f.read(), "library")
+
+    def testRoundTripReplacesExistingSymlinks(self):
+        with open(os.path.join(self.workerDir, "lib", "libfoo.so.2"), 'w') as f:
+            f.write("library")
+        os.symlink("libfoo.so.2", os.path.join(self.workerDir, "lib", "libfoo.so"))
+        os.makedirs(os.path.join(self.localDir, "lib"))
+        os.symlink("libfoo.so.1", os.path.join(self.localDir, "lib", "libfoo.so"))
+
+        self.transfer(["lib"])
+        self.assertEqual(os.readlink(os.path.join(self.localDir, "lib", "libfoo.so")), "libfoo.so.2")
+
+    def testRejectsSymlinksLeavingTheOutputDir(self):
+        os.makedirs(os.path.join(self.workerDir, "bin"))
+        for target in ["../bin/tool", "/etc/passwd"]:
+            linkPath = os.path.join(self.workerDir, "lib", "escape")
+            if os.path.lexists(linkPath):
+                os.remove(linkPath)
+            os.symlink(target, linkPath)
+            self.assertRaises(tarfile.TarError, self.transfer, ["lib", "bin"])
+        self.assertFalse(os.path.lexists(os.path.join(self.localDir, "lib", "escape")))
+
+
+if __name__ == "__main__":
+    unittest.main()
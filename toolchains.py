@@ -0,0 +1,127 @@
+##############################################################################
+#   CEGUI SDK Builder toolchain backends
+#
+#   Copyright (C) 2014-2016   Timotei Dolean <timotei21@gmail.com>
+#                             and contributing authors (see AUTHORS file)
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+##############################################################################
+import multiprocessing
+import os
+import build_utils
+
+# what a single link of a big debug build may take, used to size the link job pool of Ninja
+LINK_JOB_MEMORY = 2 * 1024 ** 3
+
+
+def getPhysicalMemory():
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+# How the SDKs are configured and built with a given toolchain: the CMake generator, the programs it needs
+# and the build commands. Single-config generators get a build tree per config, multi-config ones
+# (Visual Studio) a single tree in which every config is built.
+class Toolchain:
+    multiConfig = False
+    # the program running the build commands
+    buildProgram = None
+
+    def __init__(self, name, generator):
+        self.name = name
+        self.generator = generator
+
+    def getRequiredExes(self):
+        return ["cmake", self.buildProgram]
+
+    # the extra CMake arguments of the build tree of 'config' (None for multi-config generators)
+    def getConfigureArgs(self, config):
+        return [] if config is None else ["-DCMAKE_BUILD_TYPE=" + config]
+
+    # The extra CMake arguments which depend on the machine running the build, shared by 'parallelBuilds'
+    # builds running at the same time on it. They're added where the build is configured, and are not part of
+    # the configure fingerprint, so the same build tree is reused whatever the machine and build count.
+    def getHostConfigureArgs(self, parallelBuilds):
+        return []
+
+    # projectName is the name of the top level CMake project, targets None to build everything
+    def getBuildCommand(self, projectName, config, jobs, targets):
+        raise NotImplementedError
+
+
+class VisualStudioToolchain(Toolchain):
+    multiConfig = True
+    buildProgram = "msbuild"
+
+    def getBuildCommand(self, projectName, config, jobs, targets):
+        return build_utils.generateMSBuildCommand(projectName + ".sln", config, jobs, targets)
+
+
+class MinGWToolchain(Toolchain):
+    buildProgram = "mingw32-make"
+
+    def __init__(self, name):
+        Toolchain.__init__(self, name, "MinGW Makefiles")
+
+    def getBuildCommand(self, projectName, config, jobs, targets):
+        return build_utils.generateMingwMakeCommand(targets, jobs)
+
+
+# GCC or Clang (or anything else taking GCC's options) driven by Ninja
+class NinjaToolchain(Toolchain):
+    buildProgram = "ninja"
+
+    def __init__(self, name, cCompiler, cxxCompiler):
+        Toolchain.__init__(self, name, "Ninja")
+        self.cCompiler = cCompiler
+        self.cxxCompiler = cxxCompiler
+
+    def getRequiredExes(self):
+        return Toolchain.getRequiredExes(self) + [self.cCompiler, self.cxxCompiler]
+
+    # Compiling is bounded by the -j of each build, linking (which is where the memory goes) by a job pool
+    # sized from the memory of this machine, shared by the parallel builds running on it.
+    def getLinkJobs(self, parallelBuilds):
+        memory = getPhysicalMemory()
+        if memory is None:
+            return max(1, multiprocessing.cpu_count() // (2 * parallelBuilds))
+        return max(1, memory // LINK_JOB_MEMORY // parallelBuilds)
+
+    def getConfigureArgs(self, config):
+        return Toolchain.getConfigureArgs(self, config) + [
+            "-DCMAKE_C_COMPILER=" + self.cCompiler, "-DCMAKE_CXX_COMPILER=" + self.cxxCompiler]
+
+    def getHostConfigureArgs(self, parallelBuilds):
+        return ["-DCMAKE_JOB_POOLS=link=%d" % self.getLinkJobs(parallelBuilds), "-DCMAKE_JOB_POOL_LINK=link"]
+
+    def getBuildCommand(self, projectName, config, jobs, targets):
+        return build_utils.generateNinjaCommand(targets, jobs)
+
+
+TOOLCHAINS = dict((toolchain.name, toolchain) for toolchain in [
+    VisualStudioToolchain("msvc2008", "Visual Studio 9 2008"),
+    VisualStudioToolchain("msvc2010", "Visual Studio 10 2010"),
+    VisualStudioToolchain("msvc2012", "Visual Studio 11 2012"),
+    VisualStudioToolchain("msvc2013", "Visual Studio 12 2013"),
+    VisualStudioToolchain("msvc2015", "Visual Studio 14 2015"),
+    MinGWToolchain("mingw"),
+    NinjaToolchain("gcc", "gcc", "g++"),
+    NinjaToolchain("clang", "clang", "clang++")
+])
+
+
+def getToolchain(name):
+    return TOOLCHAINS[name]